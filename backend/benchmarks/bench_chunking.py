@@ -0,0 +1,77 @@
+"""Check that Chunking.chunking_documents scales linearly with document size.
+
+Usage (from backend/):
+    python -m benchmarks.bench_chunking [--sections 200] [--steps 5]
+
+Builds synthetic markdown with a growing number of sections and prints the
+chunking time and time per 1k chunks. A roughly constant ms/1k chunks column
+means linear scaling. The legacy substring-search parent mapping is timed on
+the same splits for comparison.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("CHUNK_SIZE", "500")
+os.environ.setdefault("CHUNK_OVERLAP", "50")
+from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+from utils.chunking import Chunking
+
+WORDS = ("giáo dục học sinh kiến thức bài học định lý chứng minh phương trình lịch sử địa lý "
+         "văn học tác phẩm nhân vật hóa học phản ứng vật lý lực chuyển động sinh học tế bào").split()
+
+
+def make_document(sections, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    for i in range(sections):
+        parts.append(f"## Chương {i}\n")
+        for j in range(3):
+            parts.append(f"### Mục {i}.{j}\n")
+            for _ in range(4):
+                parts.append(" ".join(rng.choice(WORDS) for _ in range(60)) + ".\n\n")
+    return "".join(parts)
+
+
+def legacy_parent_mapping(document, chunk_size, chunk_overlap):
+    """The previous O(splits x sections x length) mapping, kept only for comparison."""
+    headers = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3"), ("####", "Header 4")]
+    md_header_splits = MarkdownHeaderTextSplitter(headers).split_text(document)
+    splitter = RecursiveCharacterTextSplitter(separators=["\n\n", "\n", "."],
+                                              chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for split in splitter.split_documents(md_header_splits):
+        for section in md_header_splits:
+            if split.page_content in section.page_content:
+                split.metadata["raw_text"] = section.page_content
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, default=200, help="sections in the smallest document")
+    parser.add_argument("--steps", type=int, default=5, help="number of doublings")
+    parser.add_argument("--legacy", action="store_true", help="also time the old parent mapping")
+    args = parser.parse_args()
+
+    chunker = Chunking()
+    print(f"{'sections':>9} {'KB':>8} {'chunks':>8} {'time s':>8} {'ms/1k chunks':>13} {'legacy s':>9}")
+    for step in range(args.steps):
+        sections = args.sections * 2 ** step
+        document = make_document(sections)
+        start = time.perf_counter()
+        data, _, _ = chunker.chunking_documents(document, "bench.pdf")
+        elapsed = time.perf_counter() - start
+        legacy = "-"
+        if args.legacy:
+            start = time.perf_counter()
+            legacy_parent_mapping(document, chunker.chunk_size, chunker.chunk_overlap)
+            legacy = f"{time.perf_counter() - start:.2f}"
+        print(f"{sections:>9} {len(document.encode()) / 1024:>8.0f} {len(data):>8} {elapsed:>8.2f} "
+              f"{elapsed / len(data) * 1e6:>13.1f} {legacy:>9}")
+
+
+if __name__ == "__main__":
+    main()
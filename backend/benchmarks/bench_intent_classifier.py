@@ -0,0 +1,127 @@
+"""Accuracy, coverage and latency of the local intent classifier.
+
+Usage (from backend/):
+    python -m benchmarks.bench_intent_classifier                      # built-in labelled messages
+    python -m benchmarks.bench_intent_classifier --data questions.jsonl --folds 5
+    python -m benchmarks.bench_intent_classifier --llm                # also time the LLM classification
+
+--data takes JSONL lines {"question": ..., "label": "true"|"false"}, e.g. the
+INTENT_LOG_PATH file; it is split into folds and each fold is classified
+by a model trained on the seeds plus the other folds. Coverage is the share
+of messages decided locally (the rest would still go to the LLM); accuracy
+is measured on those. Rows are printed for several INTENT_MIN_MARGIN values.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from chat_query.intent_classifier import GREETING, KNOWLEDGE, SEED_EXAMPLES, IntentClassifier
+
+EVAL_EXAMPLES = [(text, KNOWLEDGE) for text in (
+    "Nêu vai trò của enzim trong tiêu hóa", "3 + 5 bằng mấy", "Cách mạng tháng Tám năm 1945",
+    "cho mình hỏi về hình học không gian", "Quang hợp xảy ra ở đâu", "Hiđro có mấy electron",
+    "Tác giả của Truyện Kiều", "Sự khác nhau giữa ADN và ARN", "Kể tên các nước Đông Nam Á",
+    "Thế nào là câu ghép", "Dòng điện xoay chiều", "Bài thơ Tây Tiến sáng tác năm nào",
+    "Tính thể tích khối cầu bán kính 3cm", "Hệ điều hành là gì", "Ý nghĩa của hiệp định Giơ-ne-vơ",
+    "Đột biến gen có những dạng nào", "Chuyển động tròn đều", "Vai trò của rừng ngập mặn",
+    "cách cân bằng phương trình hóa học", "Tại sao bầu trời màu xanh", "Nhiệt độ sôi của nước",
+    "Pháp luật có những đặc trưng gì", "Cấu trúc rẽ nhánh if else", "Lịch sử hình thành nhà Nguyễn",
+    "so sánh thơ mới và thơ cũ", "hàm số bậc nhất đồng biến khi nào", "Kim loại kiềm gồm những nguyên tố nào",
+    "Giải thích hiện tượng cầu vồng", "Sông nào dài nhất Việt Nam", "Phép lai một cặp tính trạng của Menđen",
+    # Greeting words around a real question must not be taken for small talk
+    "Chào bạn, mình muốn hỏi về Tố Hữu", "Bạn có biết Nguyễn Du không", "Chào cô, em muốn ôn tập chương 3",
+    "Bạn ơi, ADN", "xin chào, cho em hỏi bài quang hợp", "Hello bot, giúp mình môn hóa với",
+    "Cảm ơn bạn, thế còn định luật Newton thứ hai", "chào anh, em cần tài liệu về Cách mạng tháng Tám",
+)] + [(text, GREETING) for text in (
+    "xin chào bạn!", "Chào cô ạ", "bạn tên gì", "chào bot nha", "Hello bạn", "cảm ơn bạn",
+    "cám ơn nhiều nha", "bye bye", "tạm biệt nhé", "Bạn có khỏe không vậy", "hi", "chào buổi tối",
+    "oke thanks", "bạn là ai thế", "alo", "rất vui được làm quen", "Chào em", "dạ em cảm ơn ạ",
+    "good morning", "bạn khỏe không",
+)]
+
+
+def load_data(path):
+    with open(path, encoding="utf-8") as file:
+        rows = [json.loads(line) for line in file if line.strip()]
+    return [(row["question"], row["label"]) for row in rows if row.get("label") in (KNOWLEDGE, GREETING)]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def evaluate(classifier, examples, margin):
+    classifier.min_margin = margin
+    decided, correct, by_source, latencies = 0, 0, {}, []
+    for text, label in examples:
+        start = time.perf_counter()
+        predicted, source = classifier.predict(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if predicted is None:
+            continue
+        decided += 1
+        correct += predicted == label
+        stats = by_source.setdefault(source, [0, 0])
+        stats[0] += 1
+        stats[1] += predicted == label
+    return decided, correct, by_source, latencies
+
+
+def time_llm(examples):
+    from chat_query.question_type import QuestionType
+    client = QuestionType()
+
+    async def run():
+        latencies, correct = [], 0
+        for text, label in examples:
+            start = time.perf_counter()
+            answer = await client.aquestion_classification(question=text)
+            latencies.append((time.perf_counter() - start) * 1000)
+            correct += answer.strip().lower() == label
+        return latencies, correct
+
+    latencies, correct = asyncio.run(run())
+    print(f"LLM classification: accuracy {correct / len(examples):.3f}  "
+          f"p50 {percentile(latencies, 0.5):.0f} ms  p95 {percentile(latencies, 0.95):.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", help="labelled JSONL instead of the built-in messages")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--margins", type=float, nargs="*", default=[0.0, 0.04, 0.08, 0.12])
+    parser.add_argument("--llm", action="store_true", help="also measure the LLM classification (needs the API)")
+    args = parser.parse_args()
+
+    examples = load_data(args.data) if args.data else EVAL_EXAMPLES
+    folds = max(1, args.folds) if args.data else 1
+    classifier = IntentClassifier(log_path=os.devnull)
+    print(f"{len(examples)} messages ({sum(label == GREETING for _, label in examples)} greetings), {folds} fold(s)")
+    for margin in args.margins:
+        decided, correct, by_source, latencies = 0, 0, {}, []
+        for fold in range(folds):
+            test = examples[fold::folds]
+            if args.data:
+                train = [example for i, example in enumerate(examples) if i % folds != fold]
+                classifier.train(SEED_EXAMPLES + train)
+            result = evaluate(classifier, test, margin)
+            decided, correct = decided + result[0], correct + result[1]
+            for source, (count, right) in result[2].items():
+                stats = by_source.setdefault(source, [0, 0])
+                stats[0], stats[1] = stats[0] + count, stats[1] + right
+            latencies.extend(result[3])
+        sources = ", ".join(f"{source} {count} ({right / count:.2f})" for source, (count, right) in sorted(by_source.items()))
+        print(f"margin {margin:.2f}: coverage {decided / len(examples):.3f}  "
+              f"accuracy {correct / max(decided, 1):.3f}  [{sources}]  "
+              f"p50 {percentile(latencies, 0.5):.2f} ms  p95 {percentile(latencies, 0.95):.2f} ms")
+    if args.llm:
+        time_llm(examples)
+
+
+if __name__ == "__main__":
+    main()
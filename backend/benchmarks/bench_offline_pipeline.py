@@ -0,0 +1,132 @@
+"""Ingest and query the full retrieval stack without network access.
+
+Usage (from backend/):
+    python -m benchmarks.bench_offline_pipeline [--files 4] [--sections 100] [--courses 2] [--queries 200]
+    python -m benchmarks.bench_offline_pipeline --profile   # cProfile of ingestion and queries
+
+Uses EMBEDDING_BACKEND=local (hashed n-gram vectors) and throwaway
+directories for Chroma, the embedding cache, the lexical, quantized and
+parent stores and the shard registry, so it runs on an air-gapped machine
+and never touches real data. Synthetic markdown goes through the same
+chunking_stream / parent_store / sync_data path as the ingestion task.
+Prints chunk, embed and write throughput, then query_collection latency
+percentiles over all shards and for a single course. The local vectors
+say nothing about answer quality; use the numbers to find where time goes.
+"""
+import argparse
+import cProfile
+import os
+import pstats
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.bench_chunking import WORDS, make_document
+
+
+def configure(directory):
+    os.environ["EMBEDDING_BACKEND"] = "local"
+    os.environ["CHROMA_MODE"] = "persistent"
+    os.environ["CHROMA_PERSIST_DIR"] = os.path.join(directory, "chroma")
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(directory, "embedding_cache.sqlite3")
+    os.environ["LEXICAL_INDEX_DIR"] = os.path.join(directory, "lexical_index")
+    os.environ["PARENT_STORE_BACKEND"] = "local"
+    os.environ["PARENT_STORE_DIR"] = os.path.join(directory, "parent_store")
+    os.environ["QUANTIZED_INDEX_DIR"] = os.path.join(directory, "quantized_index")
+    os.environ["SHARD_REGISTRY_PATH"] = os.path.join(directory, "shards.sqlite3")
+    os.environ.setdefault("DATABASE_NAME", "bench")
+    os.environ.setdefault("OPENAI_EMBEDDINGMODEL", "text-embedding-3-small")
+    # file_processing reads the key at import; nothing here calls OpenAI
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def ingest(manager, files, sections, courses):
+    from file_processing.file_processing import chunking_stream
+    pipeline = manager.embedding_pipeline
+    embed_seconds = [0.0]
+    embed = pipeline.embed
+
+    def timed_embed(texts):
+        start = time.perf_counter()
+        try:
+            return embed(texts)
+        finally:
+            embed_seconds[0] += time.perf_counter() - start
+
+    pipeline.embed = timed_embed
+    chunks, store_seconds = 0, 0.0
+    start = time.perf_counter()
+    for i in range(files):
+        filename = f"bench_{i}.pdf"
+        course = f"course-{i % courses}" if courses else None
+        manager.register_file(filename, course)
+        existing_ids = manager.get_ids(filename, course=course)
+        for data, metadata, ids, parents in chunking_stream(make_document(sections, seed=i), filename):
+            store_start = time.perf_counter()
+            manager.parent_store.put_many(parents)
+            manager.sync_data(data, metadata, ids, existing_ids, course=course)
+            store_seconds += time.perf_counter() - store_start
+            chunks += len(ids)
+    total = time.perf_counter() - start
+    pipeline.embed = embed
+    chunk_seconds = total - store_seconds
+    write_seconds = store_seconds - embed_seconds[0]
+    print(f"Ingested {chunks} chunks from {files} files in {total:.2f}s")
+    for stage, seconds in (("chunk", chunk_seconds), ("embed", embed_seconds[0]), ("write", write_seconds)):
+        print(f"  {stage:>5}: {seconds:6.2f}s  {chunks / max(seconds, 1e-9):9.0f} chunks/s")
+
+
+def run_queries(manager, count, courses):
+    rng = random.Random(0)
+    questions = [" ".join(rng.choice(WORDS) for _ in range(8)) for _ in range(count)]
+    manager.query_collection([questions[0]], lexical_queries=[questions[0]])
+    scopes = [("all shards", None)]
+    if courses:
+        scopes.append(("one course", ["course-0"]))
+    for label, scope in scopes:
+        latencies = []
+        for question in questions:
+            start = time.perf_counter()
+            manager.query_collection([question], lexical_queries=[question], courses=scope)
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"query_collection ({label}): p50 {percentile(latencies, 0.5):6.1f} ms  "
+              f"p95 {percentile(latencies, 0.95):6.1f} ms  over {len(latencies)} queries")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--sections", type=int, default=100, help="sections per synthetic document")
+    parser.add_argument("--courses", type=int, default=2, help="spread files over N course shards (0: default shard)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--profile", action="store_true", help="print the top cProfile entries")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        configure(directory)
+        from utils.database_manage import DatabaseManager
+        manager = DatabaseManager()
+        print(f"Embedding backend {manager.embedding_backend.name}, collection {manager.database_name}")
+        profiler = cProfile.Profile() if args.profile else None
+        if profiler:
+            profiler.enable()
+        ingest(manager, args.files, args.sections, args.courses)
+        run_queries(manager, args.queries, args.courses)
+        if profiler:
+            profiler.disable()
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
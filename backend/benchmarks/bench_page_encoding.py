@@ -0,0 +1,84 @@
+"""Compare page encodings sent to the vision model.
+
+Usage (from backend/):
+    python -m benchmarks.bench_page_encoding file1.pdf [file2.pdf ...] [--mbps 20] [--transcribe]
+
+For every strategy it reports the average payload per page, the encode time
+and the estimated upload time at the given link speed. With --transcribe
+(needs OPENAI_API_KEY/OPENAI_MODEL) each page is also transcribed and compared
+against the legacy PNG@2x transcription with difflib as a quality proxy.
+"""
+import argparse
+import difflib
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("PAGE_CACHE_ENABLED", "false")
+import fitz
+from utils.parse_data import ParseHandler
+
+
+def strategies(handler):
+    def adaptive(image_format, quality):
+        def encode(page):
+            handler.image_format, handler.image_quality = image_format, quality
+            return handler.encode_page(page)
+        return encode
+
+    return {
+        "png@2.0 (legacy)": lambda page: handler.render_png(page, 2.0, 2.0),
+        "png@adaptive": lambda page: handler.render_png(page, handler.page_zoom(page), handler.page_zoom(page)),
+        "jpeg q90 adaptive": adaptive("jpeg", 90),
+        "jpeg q80 adaptive": adaptive("jpeg", 80),
+        "jpeg q60 adaptive": adaptive("jpeg", 60),
+        "webp q80 adaptive": adaptive("webp", 80),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--mbps", type=float, default=20.0, help="uplink speed used to estimate upload time")
+    parser.add_argument("--transcribe", action="store_true")
+    args = parser.parse_args()
+
+    handler = ParseHandler(api_key=os.environ.get("OPENAI_API_KEY"))
+    chat = None
+    if args.transcribe:
+        from utils.gpt_call import ChatGPTGen
+        chat = ChatGPTGen()
+
+    results = {}
+    baselines = {}
+    for path in args.pdfs:
+        document = fitz.open(path)
+        for name, encode in strategies(handler).items():
+            result = results.setdefault(name, {"pages": 0, "bytes": 0, "encode_s": 0.0, "similarity": []})
+            for page_num, page in enumerate(document):
+                start = time.perf_counter()
+                data_url = encode(page)
+                result["encode_s"] += time.perf_counter() - start
+                result["pages"] += 1
+                result["bytes"] += len(data_url)
+                if chat is not None:
+                    text = handler.transcribe_page(chat, data_url, page_num)
+                    key = (path, page_num)
+                    if key not in baselines:
+                        baselines[key] = text
+                    result["similarity"].append(difflib.SequenceMatcher(None, baselines[key], text).ratio())
+        document.close()
+
+    print(f"{'strategy':<20} {'KB/page':>9} {'encode ms':>10} {'upload ms':>10} {'similarity':>11}")
+    for name, result in results.items():
+        pages = result["pages"] or 1
+        kb = result["bytes"] / pages / 1024
+        upload_ms = result["bytes"] / pages * 8 / (args.mbps * 1e6) * 1000
+        similarity = (f"{sum(result['similarity']) / len(result['similarity']):.3f}"
+                      if result["similarity"] else "-")
+        print(f"{name:<20} {kb:>9.1f} {result['encode_s'] / pages * 1000:>10.1f} {upload_ms:>10.1f} {similarity:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Recall@k versus memory and latency for reduced-dimension and quantized embeddings.
+
+Usage (from backend/):
+    python -m benchmarks.bench_quantization                    # vectors of the configured collection
+    python -m benchmarks.bench_quantization --synthetic 50000  # clustered random vectors
+
+Queries are perturbed copies of stored vectors. Exact float32 search over
+the full vectors is the ground truth. Compared against it: float32 vectors
+shortened to --dims (text-embedding-3 vectors stay meaningful when
+truncated and renormalized, which is what the dimensions parameter
+returns), and QuantizedIndex in int8 and binary mode with several
+re-score factors. The vectors are also stored in a throwaway Chroma
+collection, which QuantizedIndex re-scores its candidates against, so the
+latency includes that get(). Memory is what each variant keeps resident
+for search, not counting Chroma's own index.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import numpy as np
+from utils.quantized_index import QuantizedIndex
+
+
+def normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def load_collection(limit):
+    from dotenv import load_dotenv
+    from utils.database_manage import create_chroma_client
+    load_dotenv()
+    collection = create_chroma_client().get_collection(os.environ['DATABASE_NAME'])
+    result = collection.get(include=["embeddings"], limit=limit)
+    return np.asarray(result['embeddings'], dtype=np.float32)
+
+
+def synthetic(count, dim, rng):
+    centers = normalize(rng.standard_normal((max(1, count // 50), dim)))
+    return normalize(centers[rng.integers(0, len(centers), count)] + 0.6 * normalize(rng.standard_normal((count, dim))))
+
+
+def recall(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+
+def exact_search(vectors, queries, k):
+    found = []
+    for scores in (vectors @ queries.T).T:
+        top = np.argpartition(-scores, k - 1)[:k]
+        found.append(list(top[np.argsort(-scores[top])]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of the collection")
+    parser.add_argument("--dim", type=int, default=1536, help="dimension of synthetic vectors")
+    parser.add_argument("--limit", type=int, default=None, help="max vectors read from the collection")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dims", type=int, nargs="*", default=[512, 256])
+    parser.add_argument("--rescore", type=int, nargs="*", default=[2, 4, 10])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic(args.synthetic, args.dim, rng) if args.synthetic else load_collection(args.limit)
+    vectors = normalize(vectors).astype(np.float32)
+    picks = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = normalize(vectors[picks] + 0.05 * normalize(rng.standard_normal((len(picks), vectors.shape[1]))))
+    queries = queries.astype(np.float32)
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, recall@{args.k}")
+
+    start = time.perf_counter()
+    truth = exact_search(vectors, queries, args.k)
+    full_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    print(f"{'float32 full':>22}: recall 1.000  memory {vectors.nbytes / 2**20:8.1f} MiB  {full_ms:6.2f} ms/query")
+
+    for dims in args.dims:
+        if dims >= vectors.shape[1]:
+            continue
+        short = normalize(vectors[:, :dims])
+        short_queries = normalize(queries[:, :dims])
+        start = time.perf_counter()
+        found = exact_search(short, short_queries, args.k)
+        ms = (time.perf_counter() - start) * 1000 / len(queries)
+        print(f"{f'float32 {dims}d':>22}: recall {recall(found, truth):.3f}  "
+              f"memory {short.nbytes / 2**20:8.1f} MiB  {ms:6.2f} ms/query")
+
+    ids = [str(i) for i in range(len(vectors))]
+    directory = tempfile.mkdtemp()
+    try:
+        import chromadb
+        client = chromadb.PersistentClient(path=os.path.join(directory, "chroma"))
+        collection = client.create_collection("bench", embedding_function=None)
+        batch = client.get_max_batch_size()
+        for i in range(0, len(vectors), batch):
+            collection.add(ids=ids[i:i + batch], embeddings=vectors[i:i + batch])
+        for mode in ("int8", "binary"):
+            index = QuantizedIndex("bench", mode=mode, directory=directory)
+            for i in range(0, len(vectors), 5000):
+                index.add(ids[i:i + 5000], vectors[i:i + 5000], [{}] * len(ids[i:i + 5000]))
+            index.search(queries[:1], collection, k=args.k)
+            for factor in args.rescore:
+                index.rescore_factor = factor
+                start = time.perf_counter()
+                results = index.search(queries, collection, k=args.k)
+                ms = (time.perf_counter() - start) * 1000 / len(queries)
+                found = [[int(chunk_id) for chunk_id, _ in row] for row in results]
+                print(f"{f'{mode} rescore x{factor}':>22}: recall {recall(found, truth):.3f}  "
+                      f"memory {index.memory_bytes() / 2**20:8.1f} MiB  {ms:6.2f} ms/query")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Compare multi-query fusion strategies for DatabaseManager.query_collection.
+
+Usage (from backend/):
+    python -m benchmarks.bench_retrieval_fusion [--queries 6] [--top-k 10] [--budget 8]
+
+Builds a synthetic corpus of sections (several chunks each) around random
+topics, issues noisy expanded queries per topic, retrieves the top-k chunks
+per query by brute-force cosine, and measures the recall of relevant
+sections within the prompt budget for the legacy sort-and-scan merge and
+each RetrievalFusion mode. Also times one fusion call.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import numpy as np
+from utils.retrieval_fusion import RetrievalFusion
+
+
+def normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def build_corpus(rng, topics, relevant, distractors, chunks, dim):
+    """Return (chunk vectors, chunk section ids, topic vectors, relevant sections per topic)."""
+    topic_vectors = normalize(rng.standard_normal((topics, dim)))
+    centers, relevant_sections = [], []
+    for t in range(topics):
+        relevant_sections.append(set(range(len(centers), len(centers) + relevant)))
+        centers.extend(normalize(topic_vectors[t] + 0.9 * normalize(rng.standard_normal((relevant, dim)))))
+    centers.extend(normalize(rng.standard_normal((distractors, dim))))
+    # Distractor sections that sit close to a topic (the hard negatives)
+    for t in range(topics):
+        centers.extend(normalize(topic_vectors[t] + 1.1 * normalize(rng.standard_normal((relevant, dim)))))
+    centers = np.array(centers)
+    section_ids = np.repeat(np.arange(len(centers)), chunks)
+    vectors = normalize(centers[section_ids] + 0.35 * normalize(rng.standard_normal((len(section_ids), dim))))
+    return vectors.astype(np.float32), section_ids, topic_vectors, relevant_sections
+
+
+def query_result(vectors, section_ids, queries, top_k):
+    """Emulate Chroma's query() output for cosine space."""
+    similarity = queries @ vectors.T
+    top = np.argsort(-similarity, axis=1)[:, :top_k]
+    return {
+        "ids": [[f"c{i}" for i in row] for row in top],
+        "distances": [(1 - similarity[q, row]).tolist() for q, row in enumerate(top)],
+        "documents": [[f"chunk {i}" for i in row] for row in top],
+        "metadatas": [[{"raw_text": f"section {section_ids[i]}"} for i in row] for row in top],
+        "embeddings": [vectors[row] for row in top],
+    }
+
+
+def legacy_select(answer, budget):
+    """The previous merge: flatten, sort by distance, scan with list membership checks."""
+    documents = []
+    for i in range(len(answer["ids"])):
+        for j in range(len(answer["distances"][0])):
+            documents.append({"id": answer["ids"][i][j], "score": answer["distances"][i][j],
+                              "metadatas": answer["metadatas"][i][j]})
+    unique_docs, top_documents = {}, []
+    for doc in sorted(documents, key=lambda x: x["score"]):
+        if doc["id"] not in unique_docs:
+            unique_docs[doc["id"]] = doc
+            if doc["metadatas"]["raw_text"] not in top_documents:
+                top_documents.append(doc["metadatas"]["raw_text"])
+        if len(top_documents) == budget:
+            break
+    return top_documents
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topics", type=int, default=50)
+    parser.add_argument("--relevant", type=int, default=8, help="relevant sections per topic")
+    parser.add_argument("--distractors", type=int, default=3000)
+    parser.add_argument("--chunks", type=int, default=4, help="chunks per section")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=6, help="expanded queries per question")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--budget", type=int, default=8, help="sections that fit in the prompt")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors, section_ids, topic_vectors, relevant_sections = build_corpus(
+        rng, args.topics, args.relevant, args.distractors, args.chunks, args.dim)
+    answers = []
+    for t in range(args.topics):
+        queries = normalize(topic_vectors[t] + 1.0 * normalize(rng.standard_normal((args.queries, args.dim))))
+        answers.append(query_result(vectors, section_ids, queries, args.top_k))
+
+    def recall(select):
+        found = 0
+        for t, answer in enumerate(answers):
+            picked = {int(text.split()[1]) for text in select(answer)}
+            found += len(picked & relevant_sections[t])
+        return found / (args.topics * min(args.relevant, args.budget))
+
+    key_of = lambda document, metadata: metadata["raw_text"]
+    text_of = lambda fusion, answer: [metadata["raw_text"] for metadata in fusion.select(answer, key_of)]
+    print(f"{args.queries} queries x top-{args.top_k}, prompt budget {args.budget} sections")
+    print(f"{'legacy':>12}: recall {recall(lambda a: legacy_select(a, args.budget)):.3f}")
+    for method, use_mmr in (("score", False), ("rrf", False), ("rrf", True)):
+        fusion = RetrievalFusion()
+        fusion.top_k, fusion.max_documents, fusion.method, fusion.use_mmr = args.top_k, args.budget, method, use_mmr
+        name = method + ("+mmr" if use_mmr else "")
+        print(f"{name:>12}: recall {recall(lambda a: text_of(fusion, a)):.3f}")
+
+    fusion = RetrievalFusion()
+    answer = answers[0]
+    for name, call in (("legacy", lambda: legacy_select(answer, args.budget)),
+                       ("fuse", lambda: fusion.fuse(answer["ids"], answer["distances"])),
+                       ("select", lambda: fusion.select(answer, key_of))):
+        start = time.perf_counter()
+        for _ in range(1000):
+            call()
+        print(f"{name:>12}: {(time.perf_counter() - start) * 1000:.1f} us per call")
+
+
+if __name__ == "__main__":
+    main()
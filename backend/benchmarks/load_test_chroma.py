@@ -0,0 +1,114 @@
+"""Concurrent ingest + query load test against the configured Chroma backend.
+
+Usage (from backend/):
+    CHROMA_MODE=http CHROMA_HOST=localhost CHROMA_PORT=8001 \
+        python -m benchmarks.load_test_chroma --writers 2 --readers 8 --duration 30
+
+Writers (standing in for Celery ingestion workers) and readers (standing in
+for API processes) run as separate OS processes, each with its own client,
+exactly like the deployed services. Random unit vectors are written and
+queried directly, so no embedding API is needed. Prints throughput and
+latency percentiles per role.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import numpy as np
+from utils.database_manage import create_chroma_client
+
+
+def _collection(args):
+    client = create_chroma_client(mode=args.mode, path=args.path)
+    return client.get_or_create_collection(name=args.collection, metadata={"hnsw:space": "cosine"})
+
+
+def _vectors(rng, count, dim):
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def writer(args, results):
+    collection = _collection(args)
+    rng = np.random.default_rng()
+    latencies, errors, deadline = [], 0, time.time() + args.duration
+    while time.time() < deadline:
+        ids = [str(uuid.uuid4()) for _ in range(args.batch)]
+        start = time.perf_counter()
+        try:
+            collection.add(ids=ids, embeddings=_vectors(rng, args.batch, args.dim).tolist(),
+                           documents=["load test chunk"] * args.batch,
+                           metadatas=[{"filename": "load_test.pdf"}] * args.batch)
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors += 1
+            print(f"writer error: {e}")
+    results.put(("ingest", latencies, errors))
+
+
+def reader(args, results):
+    collection = _collection(args)
+    rng = np.random.default_rng()
+    latencies, errors, deadline = [], 0, time.time() + args.duration
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            collection.query(query_embeddings=_vectors(rng, args.queries, args.dim).tolist(), n_results=10)
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors += 1
+            print(f"reader error: {e}")
+    results.put(("query", latencies, errors))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", default=None, help="persistent or http (defaults to CHROMA_MODE)")
+    parser.add_argument("--path", default="/tmp/chroma_load_test", help="directory for persistent mode")
+    parser.add_argument("--collection", default="load-test")
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--batch", type=int, default=32, help="chunks per add call")
+    parser.add_argument("--queries", type=int, default=6, help="query vectors per query call")
+    parser.add_argument("--dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    # Seed the collection so queries have something to search
+    collection = _collection(args)
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+        collection.add(ids=[str(uuid.uuid4()) for _ in range(100)], embeddings=_vectors(rng, 100, args.dim).tolist())
+
+    # spawn, not fork: every process opens its own client like separate services do
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = ([context.Process(target=writer, args=(args, results)) for _ in range(args.writers)] +
+                 [context.Process(target=reader, args=(args, results)) for _ in range(args.readers)])
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    print(f"mode={args.mode or os.environ.get('CHROMA_MODE', 'persistent')} writers={args.writers} "
+          f"readers={args.readers} duration={args.duration}s")
+    for role, unit in (("ingest", args.batch), ("query", args.queries)):
+        latencies = sorted(l for r, ls, _ in collected if r == role for l in ls)
+        errors = sum(e for r, _, e in collected if r == role)
+        if not latencies:
+            print(f"{role}: no successful calls, {errors} errors")
+            continue
+        print(f"{role:>6}: {len(latencies) / args.duration:8.1f} calls/s "
+              f"({len(latencies) * unit / args.duration:8.1f} items/s)  "
+              f"p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms  "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.1f} ms  errors {errors}")
+    print(f"collection size: {collection.count()}")
+
+
+if __name__ == "__main__":
+    main()
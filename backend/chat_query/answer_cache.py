@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+from constants.constants import ANSWER_CACHE_PATH
+
+VERSION_KEY = "answer_cache:version"
+NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+class AnswerCache:
+    """Semantic cache of streamed answers to /ai_tutor_query.
+
+    A question is normalized (case, spacing, trailing punctuation) and looked
+    up by exact hash first, then by cosine similarity of its embedding to the
+    cached questions of the same course scope (ANSWER_CACHE_THRESHOLD). A hit
+    returns the chunks of the original stream so they can be replayed.
+
+    Entries expire after ANSWER_CACHE_TTL seconds and are all invalidated when
+    an upload or delete changes the collection: invalidate() bumps a version
+    counter in Redis, shared by the API and worker containers, and only
+    entries stored under the current version are served. With
+    ANSWER_CACHE_REDIS_URL empty the counter lives in the SQLite file, which
+    then must be shared. When Redis is configured but cannot be read, the
+    version is unknown and the cache is bypassed (no hits, no writes) until
+    Redis answers again: the SQLite counter is not bumped by the workers and
+    would serve answers that were already invalidated.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+    version_every = 2
+    max_entries = 5000
+
+    @staticmethod
+    def get_instance():
+        if AnswerCache._instance is None:
+            with AnswerCache._instance_lock:
+                if AnswerCache._instance is None:
+                    AnswerCache._instance = AnswerCache()
+        return AnswerCache._instance
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('ANSWER_CACHE_PATH', ANSWER_CACHE_PATH)
+        self.ttl = float(os.environ.get('ANSWER_CACHE_TTL', 24 * 3600))
+        self.threshold = float(os.environ.get('ANSWER_CACHE_THRESHOLD', 0.95))
+        self.max_entries = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', self.max_entries))
+        # Every question gets an exact lookup, only some a similarity lookup
+        self.exact_hits, self.exact_misses = 0, 0
+        self.similar_hits, self.similar_misses = 0, 0
+        self._lock = threading.Lock()
+        self._version, self._version_at = None, 0.0
+        # (scope, model, version) -> (ids, unit-length embedding matrix), dropped on any write
+        self._matrices = {}
+        self._data_version = None
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, "
+            "scope TEXT NOT NULL, model TEXT NOT NULL, version INTEGER NOT NULL, question TEXT NOT NULL, "
+            "embedding BLOB, chunks TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS answers_scope ON answers (scope, model, version)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        self.connection.commit()
+        self.redis_url = os.environ.get('ANSWER_CACHE_REDIS_URL', 'redis://redis:6379/0')
+        self.redis = connect_redis(self.redis_url)
+        self._redis_retry_at = time.time()
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        question = re.sub(r"\s+", " ", unicodedata.normalize("NFC", question)).strip().lower()
+        return question.rstrip(" ?.!…")
+
+    @staticmethod
+    def scope(courses) -> str:
+        return ",".join(sorted(set(courses))) if courses else ""
+
+    def make_key(self, question: str, courses, model: str) -> str:
+        return hashlib.sha256(f"{model}\0{self.scope(courses)}\0{self.normalize(question)}".encode("utf-8")).hexdigest()
+
+    def version(self):
+        """Current collection version, re-read at most every version_every seconds; None if unknown."""
+        now = time.time()
+        if self._version is not None and now - self._version_at < self.version_every:
+            return self._version
+        if self.redis_url:
+            if self.redis is None and now >= self._redis_retry_at:
+                self._redis_retry_at = now + self.version_every
+                self.redis = connect_redis(self.redis_url)
+            if self.redis is None:
+                self._version = None
+                return None
+            try:
+                version = int(self.redis.get(VERSION_KEY) or 0)
+            except Exception as e:
+                print(f"Answer cache version read failed, cache bypassed: {e}")
+                self._version = None
+                return None
+        else:
+            with self._lock:
+                row = self.connection.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+            version = row[0] if row else 0
+        self._version, self._version_at = version, now
+        return version
+
+    def _matrix(self, scope, model, version):
+        with self._lock:
+            data_version = (self.connection.execute("PRAGMA data_version").fetchone()[0], self.connection.total_changes)
+            if data_version != self._data_version:
+                self._matrices, self._data_version = {}, data_version
+            cached = self._matrices.get((scope, model, version))
+            if cached is None:
+                rows = self.connection.execute(
+                    "SELECT id, embedding FROM answers WHERE scope = ? AND model = ? AND version = ? AND created > ? "
+                    "AND embedding IS NOT NULL", (scope, model, version, time.time() - self.ttl)
+                ).fetchall()
+                ids = [row[0] for row in rows]
+                matrix = np.array([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else None
+                cached = self._matrices[(scope, model, version)] = (ids, matrix)
+        return cached
+
+    def _entry(self, where, params):
+        """(normalized question, chunks) of the first matching entry, or None."""
+        with self._lock:
+            row = self.connection.execute(f"SELECT question, chunks FROM answers WHERE {where}", params).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def get_exact(self, question: str, courses, model: str):
+        """Chunks cached for the same normalized question, or None. Needs no embedding."""
+        version = self.version()
+        entry = None
+        if version is not None:
+            entry = self._entry("key = ? AND version = ? AND created > ?",
+                                (self.make_key(question, courses, model), version, time.time() - self.ttl))
+        if entry is None:
+            self.exact_misses += 1
+            return None
+        self.exact_hits += 1
+        return entry[1]
+
+    def has_entries(self, courses, model: str) -> bool:
+        """Whether any question of this scope could match semantically (no embedding needed)."""
+        version = self.version()
+        return version is not None and self._matrix(self.scope(courses), model, version)[1] is not None
+
+    def get_similar(self, question: str, embedding, courses, model: str):
+        """Chunks of the most similar cached question above the threshold, or None.
+
+        The numbers in both questions must also match: "bài 3" and "bài 4"
+        are near duplicates to an embedding model but not to a student.
+        """
+        version = self.version()
+        ids, matrix = self._matrix(self.scope(courses), model, version) if version is not None else ([], None)
+        chunks = None
+        if matrix is not None and len(embedding) == matrix.shape[1]:
+            query = np.asarray(embedding, dtype=np.float32)
+            scores = matrix @ (query / (np.linalg.norm(query) + 1e-12))
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                entry = self._entry("id = ? AND created > ?", (ids[best], time.time() - self.ttl))
+                if entry is not None and NUMBER.findall(entry[0]) == NUMBER.findall(self.normalize(question)):
+                    chunks = entry[1]
+        if chunks is None:
+            self.similar_misses += 1
+        else:
+            self.similar_hits += 1
+        return chunks
+
+    def put(self, question: str, courses, model: str, embedding, chunks, version=None):
+        """Store the chunks of an answer; version is the one read before answering, so an
+        invalidation that happened meanwhile leaves the entry stale. Nothing is stored while
+        the version is unknown."""
+        version = self.version() if version is None else version
+        if version is None:
+            return
+        vector = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector = (vector / (np.linalg.norm(vector) + 1e-12)).tobytes()
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO answers (key, scope, model, version, question, embedding, chunks, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.make_key(question, courses, model), self.scope(courses), model, version,
+                 self.normalize(question), vector, json.dumps(chunks, ensure_ascii=False), time.time())
+            )
+            self.connection.commit()
+        self.evict()
+
+    def evict(self):
+        """Drop expired and superseded entries, then the oldest beyond max_entries."""
+        with self._lock:
+            self.connection.execute("DELETE FROM answers WHERE created <= ? OR version < ?",
+                                    (time.time() - self.ttl, self._version or 0))
+            self.connection.execute(
+                "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY created DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self.connection.commit()
+
+    def invalidate(self):
+        """Make every cached answer stale; called when the collection changes."""
+        if self.redis_url:
+            try:
+                if self.redis is None:
+                    raise ConnectionError("Redis unreachable")
+                self._version = int(self.redis.incr(VERSION_KEY))
+                self._version_at = time.time()
+                return
+            except Exception as e:
+                # Other processes cannot be told; drop what this SQLite file holds instead
+                print(f"Answer cache invalidation through Redis failed, clearing the entries: {e}")
+                with self._lock:
+                    self.connection.execute("DELETE FROM answers")
+                    self.connection.commit()
+                self._version = None
+                return
+        with self._lock:
+            self.connection.execute(
+                "INSERT INTO meta (name, value) VALUES ('version', 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+            )
+            self.connection.commit()
+        self._version = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        lookups = self.exact_hits + self.exact_misses
+        return {"entries": entries, "exact_hits": self.exact_hits, "exact_misses": self.exact_misses,
+                "similar_hits": self.similar_hits, "similar_misses": self.similar_misses,
+                "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0}
+
+
+def connect_redis(url):
+    """Redis client for the version counter, or None if url is empty or Redis does not answer."""
+    if not url:
+        return None
+    try:
+        import redis
+        client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        client.ping()
+        return client
+    except Exception as e:
+        print(f"Answer cache cannot reach Redis ({e}), bypassed until it does")
+        return None
+
+
+def invalidate_answer_cache():
+    """Invalidate cached answers after an upload or delete, if the cache is enabled."""
+    if os.environ.get('ANSWER_CACHE_ENABLED', 'true').lower() != 'true':
+        return
+    try:
+        AnswerCache.get_instance().invalidate()
+    except Exception as e:
+        print(f"Answer cache invalidation failed: {e}")
@@ -0,0 +1,101 @@
+import math
+import os
+import re
+import threading
+
+from utils.lexical_index import LexicalIndex
+from utils.tokenizer import load_encoding
+
+SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+|\n+")
+
+
+class ContextPacker:
+    """Fits the retrieved sections into a prompt token budget.
+
+    Sections arrive in retrieval order (best first) and are added whole while
+    they fit in CONTEXT_TOKEN_BUDGET. A section longer than
+    CONTEXT_SECTION_MAX_TOKENS, or one that no longer fits but leaves at least
+    CONTEXT_MIN_TOKENS of room, is cut down to its sentences that share the
+    most syllables and syllable pairs with the question, kept in their
+    original order. Tokens are counted with the answer model's tiktoken
+    encoding.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @staticmethod
+    def get_instance():
+        if ContextPacker._instance is None:
+            with ContextPacker._instance_lock:
+                if ContextPacker._instance is None:
+                    ContextPacker._instance = ContextPacker()
+        return ContextPacker._instance
+
+    def __init__(self, budget=None, section_max_tokens=None):
+        self.encoding = load_encoding(model=os.environ.get('OPENAI_MODEL'))
+        self.budget = budget or int(os.environ.get('CONTEXT_TOKEN_BUDGET', 6000))
+        self.section_max_tokens = section_max_tokens or int(os.environ.get('CONTEXT_SECTION_MAX_TOKENS', 1500))
+        self.min_tokens = int(os.environ.get('CONTEXT_MIN_TOKENS', 150))
+        self.extract = os.environ.get('CONTEXT_EXTRACT_SENTENCES', 'true').lower() == 'true'
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    @staticmethod
+    def split_sentences(text: str):
+        return [sentence.strip() for sentence in SENTENCE_END.split(text) if sentence.strip()]
+
+    def extract_sentences(self, question: str, text: str, limit: int) -> str:
+        """The sentences of text most relevant to question, at most limit tokens, in text order."""
+        sentences = self.split_sentences(text)
+        terms = LexicalIndex.tokenize(question)
+        question_terms, question_pairs = set(terms), set(LexicalIndex.bigrams(terms))
+        tokenized = [LexicalIndex.tokenize(sentence) for sentence in sentences]
+        # Syllables frequent across the section ("của", "là") count for little
+        frequency = {}
+        for tokens in tokenized:
+            for token in set(tokens) & question_terms:
+                frequency[token] = frequency.get(token, 0) + 1
+        scores = []
+        for i, tokens in enumerate(tokenized):
+            score = sum(math.log(1 + len(sentences) / frequency[token]) for token in set(tokens) & question_terms)
+            score += 2.0 * len(set(LexicalIndex.bigrams(tokens)) & question_pairs)
+            # A heading names the topic of what follows, keep it when there is room
+            if sentences[i].startswith("#"):
+                score += 1.0
+            scores.append(score)
+        picked, used = [], 0
+        for i in sorted(range(len(sentences)), key=lambda i: (-scores[i], i)):
+            if scores[i] <= 0 and picked:
+                break
+            tokens = self.count(sentences[i]) + 1
+            if used + tokens > limit:
+                continue
+            picked.append(i)
+            used += tokens
+        return " … ".join(sentences[i] for i in sorted(picked))
+
+    def pack(self, question: str, sections):
+        """Return (packed sections, stats) where stats counts the tokens kept and dropped."""
+        packed, seen, used, tokens_in, trimmed = [], set(), 0, 0, 0
+        for section in sections or []:
+            if section in seen:
+                continue
+            seen.add(section)
+            tokens = self.count(section)
+            tokens_in += tokens
+            room = self.budget - used
+            if tokens <= min(room, self.section_max_tokens):
+                packed.append(section)
+                used += tokens
+                continue
+            limit = min(room, self.section_max_tokens)
+            if not self.extract or limit < self.min_tokens:
+                continue
+            excerpt = self.extract_sentences(question, section, limit)
+            if excerpt:
+                packed.append(excerpt)
+                used += self.count(excerpt)
+                trimmed += 1
+        return packed, {"sections_in": len(sections or []), "sections_used": len(packed), "trimmed": trimmed,
+                        "tokens_in": tokens_in, "tokens_used": used, "budget": self.budget}
@@ -0,0 +1,153 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+from constants.constants import INTENT_LOG_PATH
+from utils.embedding_backends import HashingEmbeddingBackend
+
+# Labels follow QuestionType.question_classification: "true" needs knowledge, "false" is small talk
+KNOWLEDGE, GREETING = "true", "false"
+
+GREETING_WORDS = set(
+    "xin chào chao hello hi hey alo helo yo cảm ơn cám cam on thanks thank you tks tạm biệt bye goodbye "
+    "ok oke okay vâng dạ ừ uh nhé nha nhỉ ạ à ơi bạn mình tôi tớ em anh chị thầy cô ad bot admin nhiều "
+    "lắm rất khỏe khoẻ không hả buổi sáng trưa chiều tối ngủ ngon vui gặp quen làm good morning".split()
+)
+KNOWLEDGE_CUES = re.compile(
+    r"\b(là gì|là ai|tại sao|vì sao|như thế nào|thế nào|bao nhiêu|khi nào|ở đâu|bao giờ|giải|tính|chứng minh|"
+    r"phân tích|so sánh|trình bày|nêu|giải thích|định nghĩa|công thức|ví dụ|tóm tắt|liệt kê|hãy cho|what|why|how)\b"
+    r"|\d\s*[-+*/^=<>]\s*\d"
+)
+SMALL_TALK = re.compile(
+    r"^(bạn|cậu|bot) (là ai|tên (là )?gì|làm được gì|có khỏe không|khỏe không|bao nhiêu tuổi)( (thế|vậy|nhỉ|à|ạ|nhé|nha|hả))*$"
+)
+
+SEED_EXAMPLES = [(text, KNOWLEDGE) for text in (
+    "Định lý Pythagoras là gì?", "Ai là người phát minh ra bóng đèn?", "Hôm nay thời tiết thế nào?",
+    "Giải phương trình bậc hai x^2 - 5x + 6 = 0", "Tố Hữu là ai, những tác phẩm của ông gồm những gì?",
+    "Nguyên nhân của Chiến tranh thế giới thứ nhất", "Phản ứng oxi hóa khử là gì", "Tế bào nhân thực gồm những thành phần nào",
+    "Trình bày ý nghĩa của chiến thắng Điện Biên Phủ", "Công thức tính diện tích hình tròn",
+    "Vì sao lá cây có màu xanh", "Phân tích nhân vật Mị trong Vợ chồng A Phủ", "Quyền và nghĩa vụ của công dân",
+    "Định luật Ohm phát biểu thế nào", "Vòng lặp for trong Python dùng để làm gì", "Khí hậu nhiệt đới gió mùa có đặc điểm gì",
+    "Cho mình hỏi về quang hợp", "Đạo hàm của sin x", "Lực ma sát phụ thuộc vào những yếu tố nào",
+    "Tóm tắt bài Chiếc thuyền ngoài xa", "Mạch điện nối tiếp và song song khác nhau thế nào", "Axit axetic có tính chất hóa học gì",
+)] + [(text, GREETING) for text in (
+    "Xin chào", "Xin chào, bạn có khỏe không?", "Chào bạn", "hello", "hi bot", "Cảm ơn bạn nhiều nhé",
+    "Tạm biệt", "Bạn là ai?", "Bạn tên là gì vậy", "Chào buổi sáng", "ok cảm ơn", "Rất vui được gặp bạn",
+    "Bạn làm được gì", "chúc bạn ngủ ngon", "alo alo", "Bạn có khỏe không", "thanks nha",
+)]
+
+
+class IntentClassifier:
+    """Local stand-in for the question_classification LLM call.
+
+    Rules catch the obvious cases (a message made only of greeting words,
+    question words such as "là gì" or arithmetic). Everything else goes to a
+    nearest-centroid model over hashed word and character n-gram vectors,
+    trained from SEED_EXAMPLES plus the questions the LLM labelled before
+    (INTENT_LOG_PATH). predict() returns None when the two centroids are
+    closer than INTENT_MIN_MARGIN; the caller then asks the LLM and log()s
+    the answer, so the model learns from the cases it was unsure about.
+
+    Only the pure-greeting rules may answer "false". The centroids weigh
+    pronouns and particles ("bạn", "ơi", "em") as much as content, so
+    "Chào cô, em muốn ôn tập chương 3" lands near the greetings; a centroid
+    "false" is therefore sent to the LLM too. Mislabelling a question as a
+    greeting skips retrieval, while the reverse only costs a retrieval.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+    max_log_examples = 20000
+
+    @staticmethod
+    def get_instance():
+        if IntentClassifier._instance is None:
+            with IntentClassifier._instance_lock:
+                if IntentClassifier._instance is None:
+                    IntentClassifier._instance = IntentClassifier()
+        return IntentClassifier._instance
+
+    def __init__(self, log_path=None, min_margin=None):
+        self.log_path = log_path or os.environ.get('INTENT_LOG_PATH', INTENT_LOG_PATH)
+        self.min_margin = float(os.environ.get('INTENT_MIN_MARGIN', 0.08)) if min_margin is None else min_margin
+        self.backend = HashingEmbeddingBackend(dimensions=int(os.environ.get('INTENT_DIMENSIONS', 1024)))
+        self._lock = threading.Lock()
+        self.labels, self.centroids = [], None
+        self.train(SEED_EXAMPLES + self.logged_examples())
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = unicodedata.normalize("NFC", text).lower()
+        return re.sub(r"\s+", " ", re.sub(r"[^\w\s+\-*/^=<>]", " ", text)).strip()
+
+    def logged_examples(self):
+        """(question, label) pairs labelled by the LLM, newest last."""
+        if not os.path.exists(self.log_path):
+            return []
+        examples = []
+        with open(self.log_path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("source") == "llm" and entry.get("label") in (KNOWLEDGE, GREETING):
+                    examples.append((entry["question"], entry["label"]))
+        return examples[-self.max_log_examples:]
+
+    def train(self, examples):
+        by_label = {}
+        for text, label in examples:
+            by_label.setdefault(label, []).append(self.normalize(text))
+        labels = sorted(by_label)
+        centroids = []
+        for label in labels:
+            vectors = np.asarray(self.backend.embed_batch(by_label[label]), dtype=np.float32)
+            centroid = vectors.mean(axis=0)
+            centroids.append(centroid / (np.linalg.norm(centroid) + 1e-12))
+        self.labels, self.centroids = labels, np.array(centroids)
+
+    def rule(self, text: str):
+        """Label from the rules for a normalized message, or None."""
+        words = text.split()
+        if not words:
+            return GREETING
+        if SMALL_TALK.match(text) or (len(words) <= 8 and all(word in GREETING_WORDS for word in words)):
+            return GREETING
+        if KNOWLEDGE_CUES.search(text):
+            return KNOWLEDGE
+        return None
+
+    def scores(self, text: str) -> dict:
+        vector = np.asarray(self.backend.embed_batch([text])[0], dtype=np.float32)
+        return dict(zip(self.labels, (self.centroids @ vector).tolist()))
+
+    def predict(self, question: str):
+        """(label, source) with source "rule" or "centroid"; label is None when unsure."""
+        text = self.normalize(question)
+        label = self.rule(text)
+        if label is not None:
+            return label, "rule"
+        scores = self.scores(text)
+        if len(scores) < 2:
+            return None, "centroid"
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if ranked[0][0] == GREETING or ranked[0][1] - ranked[1][1] < self.min_margin:
+            return None, "centroid"
+        return ranked[0][0], "centroid"
+
+    def log(self, question: str, label: str, source: str = "llm"):
+        """Append a labelled question for the next training run."""
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as file:
+                    file.write(json.dumps({"question": question, "label": label, "source": source,
+                                           "time": time.time()}, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Intent log write failed: {e}")
@@ -1,30 +1,194 @@
 import os
 import sys
 import time
+import re
 import asyncio
+import logging
+from contextlib import aclosing
+from chat_query.answer_cache import AnswerCache
+from chat_query.context_packer import ContextPacker
+from chat_query.intent_classifier import IntentClassifier
 from chat_query.question_type import QuestionType
 from utils.database_manage import DatabaseManager
 
-def query(question: str):
+logger = logging.getLogger(__name__)
+
+# "Điều 5", "khoản 2", "Bài 3", "định lý 1.2": the lexical index finds these directly
+EXACT_REFERENCE = re.compile(
+    r"\b(điều|khoản|điểm|chương|mục|phần|bài|tiết|định lý|định luật|ví dụ|bảng|hình)\s+\d+(\.\d+)*",
+    re.IGNORECASE
+)
+
+
+def is_exact_reference(question: str) -> bool:
+    return EXACT_REFERENCE.search(question) is not None
+
+
+def speculative(coro) -> asyncio.Task:
+    """Start coro as a task whose result may be thrown away (cancelled or never awaited)."""
+    task = asyncio.create_task(coro)
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+
+async def retrieve(client: QuestionType, question: str, courses, hyde_task, improve_task):
+    """Wait for both query expansions, then search with them."""
+    hypothetical_document, question_context = await asyncio.gather(hyde_task, improve_task)
+    document_query = client.build_document_query(hypothetical_document, question_context)
+    database_manager = DatabaseManager.get_instance()
+    return await asyncio.to_thread(database_manager.query_collection, questions=document_query,
+                                   lexical_queries=[question], courses=courses)
+
+
+def local_intent(question: str):
+    """(label, source) from the local classifier; label is None when the LLM has to decide."""
+    if os.environ.get('INTENT_CLASSIFIER_ENABLED', 'true').lower() != 'true':
+        return None, None
+    try:
+        return IntentClassifier.get_instance().predict(question)
+    except Exception as e:
+        print(f"Intent classifier failed: {e}")
+        return None, None
+
+
+def log_prompt_tokens(result: dict):
+    """Log the prompt size and how much of the retrieved context answer_question() kept."""
+    if "tokens_used" not in result:
+        return
+    logger.info(f"Answer prompt: {result.get('prompt_tokens')} tokens ({result.get('completion_tokens')} completion), "
+                f"context {result['tokens_used']} of {result['tokens_in']} retrieved tokens "
+                f"(budget {result['budget']}) in {result['sections_used']}/{result['sections_in']} sections "
+                f"({result['trimmed']} trimmed)")
+
+
+async def similar_answer(cache: AnswerCache, question: str, courses, model: str):
+    """(cached chunks or None, question embedding) from the semantic answer cache."""
+    database_manager = DatabaseManager.get_instance()
+    embedding = (await asyncio.to_thread(database_manager.embedding_pipeline.embed, [cache.normalize(question)]))[0]
+    return await asyncio.to_thread(cache.get_similar, question, embedding, courses, model), embedding
+
+
+async def query(question: str, courses: list[str] = None):
+    """Stream the answer to question, replaying the cached answer of a similar question if there is one.
+
+    The exact-match lookup needs no network call and runs first. The
+    semantic lookup needs the question embedding, so it runs next to the
+    answer pipeline instead of before it, and only when the course scope has
+    cached answers; if it hits before the first answer chunk, the pipeline is
+    cancelled and the cached answer replayed. Exact references ("Điều 5")
+    only hit on the same normalized question: "Điều 5" and "Điều 6" embed
+    almost identically.
+    """
+    if os.environ.get('ANSWER_CACHE_ENABLED', 'true').lower() != 'true':
+        result = {}
+        async with aclosing(answer_question(question, courses, result)) as chunks:
+            async for chunk in chunks:
+                yield chunk
+        log_prompt_tokens(result)
+        return
+
+    cache = AnswerCache.get_instance()
+    model = DatabaseManager.get_instance().embedding_backend.name
+    semantic = not is_exact_reference(question)
+    cached, version, lookup = None, None, None
+    try:
+        version = await asyncio.to_thread(cache.version)
+        # While the version is unknown (Redis down) get_exact misses and nothing is stored below
+        cached = await asyncio.to_thread(cache.get_exact, question, courses, model)
+        if cached is None and semantic and await asyncio.to_thread(cache.has_entries, courses, model):
+            lookup = speculative(similar_answer(cache, question, courses, model))
+    except Exception as e:
+        print(f"Answer cache lookup failed: {e}")
+    if cached is not None:
+        for chunk in cached:
+            yield chunk
+        return
+
+    result, collected = {}, []
+    async with aclosing(answer_question(question, courses, result)) as chunks:
+        first = asyncio.ensure_future(anext(chunks, None))
+        if lookup is not None:
+            await asyncio.wait({lookup, first}, return_when=asyncio.FIRST_COMPLETED)
+            if lookup.done() and lookup.exception() is None and lookup.result()[0] is not None:
+                first.cancel()
+                await asyncio.gather(first, return_exceptions=True)
+                for chunk in lookup.result()[0]:
+                    yield chunk
+                return
+        chunk = await first
+        while chunk is not None:
+            collected.append(chunk)
+            yield chunk
+            chunk = await anext(chunks, None)
+    log_prompt_tokens(result)
+    if result.get("complete") and version is not None:
+        try:
+            embedding = None
+            if lookup is not None:
+                embedding = (await lookup)[1]
+            elif semantic:
+                # Off the critical path: the answer has been streamed already
+                embedding = (await asyncio.to_thread(DatabaseManager.get_instance().embedding_pipeline.embed,
+                                                     [cache.normalize(question)]))[0]
+            await asyncio.to_thread(cache.put, question, courses, model, embedding, collected, version)
+        except Exception as e:
+            print(f"Answer cache write failed: {e}")
+
+
+async def answer_question(question: str, courses, result: dict):
+    """Stream the answer to question; result["complete"] is set once a knowledge answer finished.
+
+    Most messages are classified locally (IntentClassifier); greetings then
+    make no retrieval calls at all. Otherwise classification, hyDE and query
+    rewriting are independent LLM calls, so they run at the same time, and
+    retrieval starts as soon as both expansions are back, without waiting
+    for the classification. If the question turns out to be a greeting the
+    retrieval is cancelled.
+    """
     client = QuestionType()
+    pending = []
     try:
         print(2)
-        question_type = client.question_classification(question=question)
+        # Exact references are knowledge questions that BM25 matches as written,
+        # so they skip the classification and query-rewriting LLM calls.
+        if is_exact_reference(question):
+            question_type = "true"
+            retrieval = speculative(asyncio.to_thread(
+                DatabaseManager.get_instance().query_collection,
+                questions=[question], lexical_queries=[question], courses=courses
+            ))
+            pending.append(retrieval)
+        else:
+            intent, source = local_intent(question)
+            retrieval = None
+            if intent != "false":
+                hyde = speculative(client.ahyDE_improve(question))
+                improve = speculative(client.aimprove_question(question=question))
+                retrieval = speculative(retrieve(client, question, courses, hyde, improve))
+                pending.extend([hyde, improve, retrieval])
+            if intent is None:
+                classification = speculative(client.aquestion_classification(question=question))
+                pending.append(classification)
+                intent = await classification
+                if source is not None:
+                    IntentClassifier.get_instance().log(question, intent.strip().lower())
+            question_type = intent
         print(question_type)
         if question_type == "true":
 
             try:
 
-                document_query = client.get_document_query(question)
-                print(document_query)
-                database_manager = DatabaseManager()
-
-                document = database_manager.query_collection(questions=document_query)
+                document = await retrieval
+                # Only the best sections, trimmed to the token budget, go into the prompt
+                document, context_stats = await asyncio.to_thread(
+                    lambda: ContextPacker.get_instance().pack(question, document))
                 print(document)
                 collected_result = ""
-                for chunk in client.query_from_chatgpt(question=question, info=document):
+                usage = {}
+                async for chunk in client.aquery_from_chatgpt(question=question, info=document, usage=usage):
                     collected_result += chunk
                     yield chunk
+                result.update(context_stats, **usage)
               
                 if "Xin lỗi bạn, có thể dữ liệu được cung cấp không có thông tin về kiến thức này." in collected_result:
                     if(document!=None and len(document[:3])>0):
@@ -35,28 +199,37 @@ def query(question: str):
                         for info in infos:
                             yield f"\n{i}. "
                             i=i+1
-                            for chunk in client.query_relevant_question(info):
+                            async for chunk in client.aquery_relevant_question(info):
                                 yield chunk
+                result["complete"] = True
  
 
             except Exception as err:
                 yield f'Error format from answer: {err}'
         else:
-            answer = client.query_greeting(question=question)
+            if retrieval is not None:
+                retrieval.cancel()
+            answer = await client.aquery_greeting(question=question)
             print(answer)
             yield answer
             
     except Exception as e:
         yield f"Error when query: {e}"
+    finally:
+        # Also reached when the client disconnects mid-stream
+        for task in pending:
+            task.cancel()
+
+
 def gen_quiz(filenames:list[str]):
     client = QuestionType()
     content=[]
     metadata=[]
     quizzs=[]
     concat_to_quiz = []
-    database_manager = DatabaseManager()
+    database_manager = DatabaseManager.get_instance()
     for filename in filenames:
-        collection=database_manager.collection.get(where={"filename":filename})
+        collection=database_manager.shard_for_file(filename).collection.get(where={"filename":filename})
         content.extend(collection['documents'])
         metadata.extend(collection['metadatas'])
         content_to_concat = []
@@ -30,7 +30,8 @@ class QuestionType:
     def __init__(self):
         self.client = ChatGPTGen()
 
-    def question_classification(self, question: str) -> str:
+    @staticmethod
+    def classification_messages(question: str):
         system_contents = (
             "1. Bạn đang đóng vai trò là một chatbot hỗ trợ giáo dục.\n"
             "2. Bạn được xây dựng để trả lời các câu hỏi liên quan đến kiến thức học tập trong các môn học khác nhau bao gồm: Toán, Vật lý, Hóa học, Sinh học,Văn học, Lịch sử, Địa lý, Giáo dục công dân, Công nghệ, Tin học.\n"
@@ -46,10 +47,16 @@ class QuestionType:
             "   - 'Ai là người phát minh ra bóng đèn?' -> true"
         )
 
-        messages = create_message(system_contents, user_contents=question)
-        return self.client.default_chat_completion(messages)
+        return create_message(system_contents, user_contents=question)
 
-    def improve_question(self, question: str) -> str:
+    def question_classification(self, question: str) -> str:
+        return self.client.retry_chat_completion(self.classification_messages(question))
+
+    async def aquestion_classification(self, question: str) -> str:
+        return await self.client.aretry_chat_completion(self.classification_messages(question))
+
+    @staticmethod
+    def improve_question_messages(question: str):
         system_contents =  (
             "1. Bạn đang đóng vai trò là một chatbot hỗ trợ giáo dục.\n"
             "2. Bạn được xây dựng để trả lời các câu hỏi liên quan đến kiến thức học tập trong các môn học khác nhau gồm: Toán, Vật lý, Hóa học,Văn học, Sinh học, Lịch sử, Địa lý, Giáo dục công dân, Công nghệ, Tin học\n"
@@ -61,10 +68,16 @@ class QuestionType:
             "8. Kết quả trả về ở định dạng json."
             "9. Ví dụ về câu hỏi và câu trả lời: Câu hỏi:bạn hãy cho tôi biết Tố hữu là ai, những tác phẩm của ông gồm những gì?, Câu trả lời: {'summary': 'Tố hữu là ai, những tác phẩm của tố hữu', 'items': ['Tố Hữu','Tác phẩm của Tố Hữu'],}"
         )
-        messages = create_message(system_contents, user_contents=question)
-        return self.client.default_chat_completion(messages)
+        return create_message(system_contents, user_contents=question)
 
-    def query_greeting(self, question: str) -> str:
+    def improve_question(self, question: str) -> str:
+        return self.client.retry_chat_completion(self.improve_question_messages(question))
+
+    async def aimprove_question(self, question: str) -> str:
+        return await self.client.aretry_chat_completion(self.improve_question_messages(question))
+
+    @staticmethod
+    def greeting_messages(question: str):
         system_contents = (
              "1. Bạn đang đóng vai trò là một chatbot hỗ trợ giáo dục.\n"
             "2. Bạn được xây dựng bởi team AI.\n"
@@ -74,10 +87,16 @@ class QuestionType:
             "6. Không được cung cấp thêm thông tin gì ngoài những thông tin mà tôi cung cấp"
         )
 
-        messages = create_message(system_contents, user_contents=question)
-        return self.client.default_chat_completion(messages)
+        return create_message(system_contents, user_contents=question)
+
+    def query_greeting(self, question: str) -> str:
+        return self.client.retry_chat_completion(self.greeting_messages(question))
+
+    async def aquery_greeting(self, question: str) -> str:
+        return await self.client.aretry_chat_completion(self.greeting_messages(question))
 
-    def query_relevant_question(self,  info):
+    @staticmethod
+    def relevant_question_messages(info):
         """
             Struct of histories: a array of question and answer of system.
             Example: histories=[
@@ -101,9 +120,14 @@ class QuestionType:
 
         )
         user_contents = f' Thông tin:{info}'
-        messages = create_message(system_contents, user_contents)
+        return create_message(system_contents, user_contents)
+
+    def query_relevant_question(self, info):
+        for chunk in self.client.stream_chat_completion(self.relevant_question_messages(info)):
+            yield chunk
 
-        for chunk in self.client.stream_chat_completion(messages):
+    async def aquery_relevant_question(self, info):
+        async for chunk in self.client.astream_chat_completion(self.relevant_question_messages(info)):
             yield chunk
 
     def get_summary(self, content):
@@ -117,9 +141,10 @@ class QuestionType:
         )
         user_content = f'Mô tả ngắn gọn nội dung sau, ngoài ra không trả lời gì thêm: {content}'
         messages = create_message(system_contents, user_content)
-        return self.client.default_chat_completion(messages)
+        return self.client.retry_chat_completion(messages)
 
-    def hyDE_improve(self, question: str):
+    @staticmethod
+    def hyDE_messages(question: str):
         system_contents = (
             "1. Bạn đang đóng vai trò là một chatbot hỗ trợ giáo dục.\n"
             "2. Bạn được xây dựng để trả lời các câu hỏi liên quan đến kiến thức học tập trong các môn học khác nhau bao gồm:Toán, Vật lý, Hóa học,Văn học, Sinh học, Lịch sử, Địa lý, Giáo dục công dân, Công nghệ, Tin học\n"
@@ -128,11 +153,17 @@ class QuestionType:
             "5. Trả về đoạn văn chứa câu trả lời, ngoài ra không được đưa ra thêm bất kỳ thông tin gì.\n"
             "6. Trả lời bằng tiếng Việt."
         )
-        messages = create_message(system_contents, question)
-        return self.client.default_chat_completion(messages, token_output=150)
+        return create_message(system_contents, question)
+
+    def hyDE_improve(self, question: str):
+        return self.client.retry_chat_completion(self.hyDE_messages(question), token_output=150)
+
+    async def ahyDE_improve(self, question: str):
+        return await self.client.aretry_chat_completion(self.hyDE_messages(question), token_output=150)
 
     
-    def query_from_chatgpt(self, question: str, info, histories=None):
+    @staticmethod
+    def answer_messages(question: str, info, histories=None):
         """
             Struct of histories: a array of question and answer of system.
             Example: histories=[
@@ -156,23 +187,33 @@ class QuestionType:
         )
 
         user_contents = f' Câu hỏi: {question}, Thông tin liên quan:{info}'
-        messages = create_message(systemt_contents, user_contents, histories)
-        for chunk in self.client.stream_chat_completion(messages):
+        return create_message(systemt_contents, user_contents, histories)
+
+    def query_from_chatgpt(self, question: str, info, histories=None):
+        for chunk in self.client.stream_chat_completion(self.answer_messages(question, info, histories)):
+            yield chunk
+
+    async def aquery_from_chatgpt(self, question: str, info, histories=None, usage: dict = None):
+        messages = self.answer_messages(question, info, histories)
+        async for chunk in self.client.astream_chat_completion(messages, usage=usage):
             yield chunk
 
     def get_document_query(self, question):
-        document_query = []
         hypothetical_document = self.hyDE_improve(question)
-        document_query.append(hypothetical_document)
-
         question_context = self.improve_question(question=question)
+        return self.build_document_query(hypothetical_document, question_context)
+
+    @staticmethod
+    def build_document_query(hypothetical_document: str, question_context: str):
+        """Retrieval queries from the hyDE passage and the improve_question json."""
+        document_query = [hypothetical_document]
         print(question_context)
-        question_context = question_context.replace("'", '"')
-        question_context = json.loads(question_context)
+        question_context = json.loads(question_context.replace("'", '"'))
         document_query.append(question_context['summary'])
         document_query.extend(question_context['items'])
         print(document_query)
         return document_query
+
     def gen_question(self,content):
         systemt_contents=  f"""
             Bạn là một trợ lý AI chuyên tạo câu hỏi trắc nghiệm từ văn bản. 
@@ -202,7 +243,7 @@ class QuestionType:
         messages = create_message(systemt_contents, user_contents)
        
         try:
-            response=self.client.default_chat_completion(messages)
+            response=self.client.retry_chat_completion(messages)
             quizzes = eval(response)  # Chuyển JSON text sang list dict
         except:
             quizzes = [{"error": "Lỗi xử lý JSON từ AI."}]
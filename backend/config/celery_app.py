@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.signals import worker_process_init
 
 
 celery_app = Celery(
@@ -14,4 +15,14 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
-)
\ No newline at end of file
+)
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Open the shared Chroma client once per worker process, after the fork."""
+    from utils.database_manage import DatabaseManager
+    try:
+        DatabaseManager.get_instance()
+    except Exception as e:
+        print(f"DatabaseManager warm-up failed: {e}")
@@ -3,6 +3,15 @@ import os
 CUR_DIRECTORY = os.path.dirname(os.path.realpath(__file__)).replace('\\', '/')
 SRC_DIRECTORY = os.path.dirname(CUR_DIRECTORY)
 DB_DIRECTORY = SRC_DIRECTORY + "/chromadb"
+PAGE_CACHE_DIRECTORY = SRC_DIRECTORY + "/page_cache"
+CHECKPOINT_DIRECTORY = SRC_DIRECTORY + "/ingest_checkpoints"
+EMBEDDING_CACHE_PATH = SRC_DIRECTORY + "/embedding_cache/embeddings.sqlite3"
+LEXICAL_INDEX_DIRECTORY = SRC_DIRECTORY + "/lexical_index"
+PARENT_STORE_DIRECTORY = SRC_DIRECTORY + "/parent_store"
+QUANTIZED_INDEX_DIRECTORY = SRC_DIRECTORY + "/quantized_index"
+SHARD_REGISTRY_PATH = SRC_DIRECTORY + "/shards/registry.sqlite3"
+ANSWER_CACHE_PATH = SRC_DIRECTORY + "/answer_cache/answers.sqlite3"
+INTENT_LOG_PATH = SRC_DIRECTORY + "/intent_log/questions.jsonl"
 
 BUCKET_NAME = "files"
 BUCKET_NAME_SLIDE = "slides"
@@ -10,3 +19,5 @@ BUCKET_NAME_METADATA = "metadata"
 BUCKET_NAME_SCRIPTS = "scripts"
 BUCKET_NAME_AUDIO = "audios"
 BUCKET_NAME_VIDEO = "videos"
+BUCKET_NAME_PAGE_CACHE = "page-cache"
+BUCKET_NAME_PARENTS = "parents"
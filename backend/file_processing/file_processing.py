@@ -4,14 +4,45 @@ import os
 
 
 api_key = os.environ["OPENAI_API_KEY"]
+parse_mode = os.environ.get("PARSE_MODE", "vision")
 
-def parsing(file_stream, pdf_path):
+def parsing(file_stream, pdf_path, mode=None, done_pages=None, on_page=None):
     parsehandler = ParseHandler.get_instance(api_key=api_key)
-    image_base64s = parsehandler.pdf_to_images(file_stream, pdf_path)
-    content= parsehandler.parse_pdf(image_base64s, pdf_path)
+    pages = parsehandler.iter_pages(file_stream, mode=mode or parse_mode, skip_pages=set(done_pages or {}))
+    content= parsehandler.parse_pdf(pages, pdf_path, done_pages=done_pages, on_page=on_page)
     return content
 
+def count_pages(file_stream):
+    return ParseHandler.page_count(file_stream)
+
+def parsing_stats():
+    """Page and cache statistics of the last parsing() call in this process."""
+    return ParseHandler.get_instance(api_key=api_key).last_parse_stats
+
 def chunking(content,filename):
     chunkhandler = Chunking()
     data, metadata, ids=chunkhandler.chunking_documents(content,filename)
     return  data, metadata, ids
+
+def chunking_stream(content, filename, batch_size=64, stats=None, dedup=None):
+    """Yield (data, metadata, ids, parents) batches as soon as batch_size chunks are split.
+
+    parents maps the parent_id of every section first seen in the batch to its
+    text; it has to be stored before the chunks that reference it.
+    If stats is a dict it receives the chunk token distribution at the end.
+    dedup (a ChunkDeduplicator) drops repeated chunks before they are yielded.
+    """
+    chunkhandler = Chunking()
+    data, metadata, ids, parents = [], [], [], {}
+    for chunk, mts, chunk_id in chunkhandler.iter_chunks(content, filename, dedup=dedup, parents=parents):
+        data.append(chunk)
+        metadata.append(mts)
+        ids.append(chunk_id)
+        if len(data) >= batch_size:
+            yield data, metadata, ids, dict(parents)
+            data, metadata, ids = [], [], []
+            parents.clear()
+    if data or parents:
+        yield data, metadata, ids, dict(parents)
+    if stats is not None:
+        stats.update(chunkhandler.token_stats)
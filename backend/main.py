@@ -4,8 +4,11 @@ import logging
 import os
 from datetime import datetime
 import subprocess
+from contextlib import asynccontextmanager
 from celery import chain
 from celery.result import AsyncResult
+from chat_query.context_packer import ContextPacker
+from chat_query.intent_classifier import IntentClassifier
 from chat_query.query import gen_quiz, query
 from config.celery_app import celery_app
 from config.minio_client import (bucket_name, bucket_name_script,
@@ -14,6 +17,7 @@ from fastapi import FastAPI, File, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse,JSONResponse
 from pydantic import BaseModel
+from typing import List, Optional
 from tasks import generate_lecture, save_pdf_to_minio, upload_slide
 from utils.database_manage import DatabaseManager
 from typing_extensions import Annotated
@@ -28,12 +32,35 @@ logger = logging.getLogger(__name__)
 
 class TutorQuery(BaseModel):
     question: str
+    # Restrict retrieval to these courses; all courses are searched when empty
+    courses: Optional[List[str]] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up the shared vector store client once instead of on every request
+    try:
+        await asyncio.to_thread(DatabaseManager.get_instance)
+        logger.info("DatabaseManager ready")
+    except Exception as e:
+        logger.error(f"DatabaseManager warm-up failed: {e}")
+    try:
+        await asyncio.to_thread(IntentClassifier.get_instance)
+    except Exception as e:
+        logger.error(f"Intent classifier warm-up failed: {e}")
+    try:
+        # Loads the tiktoken encoding, which may download it on first use
+        await asyncio.to_thread(ContextPacker.get_instance)
+    except Exception as e:
+        logger.error(f"Context packer warm-up failed: {e}")
+    yield
 
 
 app = FastAPI(
     title="Chat API",
     description="API for chat application",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Cấu hình CORS
@@ -53,7 +80,14 @@ class UploadResponse(BaseModel):
 @app.post("/upload_pdf/", response_model=UploadResponse)
 async def upload_file(file: Annotated[UploadFile, File(description="Upload file to the specify folder")],
                       folder_path: str = "input",
-                      overwrite: bool = True) -> UploadResponse:
+                      overwrite: bool = True,
+                      course: Optional[str] = None) -> UploadResponse:
+    """Queue the ingestion of a PDF into the collection shard of course.
+
+    With overwrite (the default), uploading a file that already exists
+    re-ingests it instead of answering "already exists": only new or changed
+    chunks are embedded, chunks no longer in the file are deleted.
+    """
     if file.content_type != "application/pdf":
         return {"error": "Chỉ chấp nhận file PDF"}
 
@@ -61,7 +95,7 @@ async def upload_file(file: Annotated[UploadFile, File(description="Upload file
 
     filename = file.filename
 
-    task = save_pdf_to_minio.delay(file_data, filename, folder_path, overwrite)
+    task = save_pdf_to_minio.delay(file_data, filename, folder_path, overwrite, course)
 
     return {"task_id": task.id, "message": "File đang được tải lên"}
 
@@ -131,6 +165,8 @@ def get_task_status(task_id: str):
         return {"status": "Thành công", "result": task_result.result}
     elif task_result.state == "FAILURE":
         return {"status": "Thất bại"}
+    elif task_result.state == "PROGRESS":
+        return {"status": "Đang xử lý", "progress": task_result.info}
     else:
         return {"status": task_result.state}
 
@@ -207,9 +243,9 @@ async def delete_pdf(filename: str):
 @app.post("/ai_tutor_query")
 async def ai_tutor_query(query_data: TutorQuery):
     try:
-        def stream_answer():
+        async def stream_answer():
             try:
-                for chunk in query(question=query_data.question):
+                async for chunk in query(question=query_data.question, courses=query_data.courses):
                     yield f"data: {chunk}\n\n"
             except Exception as e:
                 yield f"data: Lỗi server, vui lòng thử lại sau!\n\n"
@@ -241,9 +277,17 @@ def gen_quizz(filenames: list[str]):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+@app.get("/health/ready")
+def health_ready():
+    status = DatabaseManager.readiness()
+    if not status["ready"]:
+        return JSONResponse(content=status, status_code=503)
+    return status
+
+
 @app.get("/test")
 def test():
-    data = DatabaseManager()
+    data = DatabaseManager.get_instance()
     return data.collection.get()
 ####### Dat
 
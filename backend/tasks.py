@@ -1,6 +1,8 @@
 import io
 import os
+import threading
 
+from chat_query.answer_cache import invalidate_answer_cache
 from chat_query.query import query
 from config.celery_app import celery_app
 from config.minio_client import bucket_name, bucket_name_slide, minio_client
@@ -8,54 +10,139 @@ from constants.constants import (BUCKET_NAME, BUCKET_NAME_AUDIO,
                                  BUCKET_NAME_METADATA, BUCKET_NAME_SCRIPTS,
                                  BUCKET_NAME_SLIDE, BUCKET_NAME_VIDEO)
 from fastapi import HTTPException, status
-from file_processing.file_processing import chunking, parsing
+from file_processing.file_processing import chunking_stream, count_pages, parsing, parsing_stats
 from gen_lecture.e2e_lecture import LectureGenerator
 from fastapi import HTTPException
 from PIL import Image
 from utils.database_manage import DatabaseManager
+from utils.dedup import ChunkDeduplicator
+from utils.gpt_call import is_retryable_error
+from utils.ingest_checkpoint import IngestCheckpoint
 from utils.minio_utils import save_file_to_minio
 
+chunk_batch_size = int(os.environ.get('CHUNK_BATCH_SIZE', 64))
+dedup_enabled = os.environ.get('CHUNK_DEDUP', 'true').lower() == 'true'
+dedup_max_distance = int(os.environ.get('CHUNK_DEDUP_MAX_DISTANCE', 7))
+# Near-duplicate merging can drop chunks whose wording really differs, so it is opt-in
+dedup_near = os.environ.get('CHUNK_NEAR_DEDUP', 'false').lower() == 'true'
+
+
+@celery_app.task(name='tasks.save_pdf_to_minio', bind=True, max_retries=5)
+def save_pdf_to_minio(self, file_data: bytes, filename: str, folder_path: str, overwrite: bool, course: str = None):
+    """Ingest a PDF in checkpointed stages: parse -> write txt -> chunk + embed -> upload.
+
+    Chunks go to the collection shard of course (the default collection if None).
+
+    Transcribed pages and stage outputs are persisted by IngestCheckpoint, so a
+    retry after a transient OpenAI error resumes from the last completed page
+    and stage instead of starting over. The checkpoint is removed once the
+    task ends, whether it succeeded or failed for good. Progress is published
+    as task meta.
+    """
+    checkpoint = IngestCheckpoint(file_data, filename)
+    # self.request is thread-local, pages finish on parser worker threads
+    task_id = self.request.id
+
+    def report(stage, pages_done, total_pages):
+        self.update_state(task_id=task_id, state="PROGRESS", meta={"stage": stage, "pages_done": pages_done,
+                                                   "total_pages": total_pages})
 
-@celery_app.task(name='tasks.save_pdf_to_minio')
-def save_pdf_to_minio(file_data: bytes, filename: str, folder_path: str, overwrite: bool):
     try:
-        file_stream = io.BytesIO(file_data)
-        content = parsing(file_stream, filename)
         full_folder_path = os.path.join("graphrag_tutor/index", folder_path)
         txt_filename = filename.replace(".pdf", ".txt")
         if ".." in folder_path or not os.path.isdir(full_folder_path):
             raise HTTPException(status_code=400, detail="Invalid Path.")
-        if not overwrite and  os.path.isfile(os.path.join(full_folder_path, txt_filename)):
-            raise HTTPException(status_code=400, detail=f"Existing file at {os.path.join(folder_path, txt_filename)}")
-        try:
-            with open(os.path.join(full_folder_path, txt_filename), 'w', encoding="utf-8") as f:
-                f.write(content)
-        except Exception as e:
-            return HTTPException(status_code=500, detail=f"Fail to upload file: {str(e)}")
-        data, metadata, ids = chunking(content, filename=filename)
+
+        total_pages = count_pages(io.BytesIO(file_data))
+        done_pages = checkpoint.load_pages()
+        if not checkpoint.reached("parse"):
+            progress_lock = threading.Lock()
+            report("parse", len(done_pages), total_pages)
+
+            def on_page(page_num, page_content):
+                checkpoint.save_page(page_num, page_content)
+                with progress_lock:
+                    done_pages[page_num] = page_content
+                    report("parse", len(done_pages), total_pages)
+
+            parsing(io.BytesIO(file_data), filename, done_pages=dict(done_pages), on_page=on_page)
+            checkpoint.complete("parse", total_pages=total_pages, parse_stats=parsing_stats())
+        content = "".join("\n" + done_pages[page_num] for page_num in sorted(done_pages))
+
+        if not checkpoint.reached("write_txt"):
+            report("write_txt", total_pages, total_pages)
+            if not overwrite and  os.path.isfile(os.path.join(full_folder_path, txt_filename)):
+                raise HTTPException(status_code=400, detail=f"Existing file at {os.path.join(folder_path, txt_filename)}")
+            try:
+                with open(os.path.join(full_folder_path, txt_filename), 'w', encoding="utf-8") as f:
+                    f.write(content)
+            except Exception as e:
+                checkpoint.clear()
+                return HTTPException(status_code=500, detail=f"Fail to upload file: {str(e)}")
+            checkpoint.complete("write_txt")
 
         try:
             minio_client.stat_object(bucket_name, filename)
-            return f"File {filename} đã tồn tại trong MinIO."
+            if not overwrite:
+                checkpoint.clear()
+                return f"File {filename} đã tồn tại trong MinIO."
         except Exception as e:
             if "NoSuchKey" in str(e):
                 pass
             else:
+                checkpoint.clear()
                 return f"Error checking file existence: {str(e)}"
 
-        databaseManager = DatabaseManager()
-        databaseManager.add_data(data, metadata, ids)
+        if not checkpoint.reached("embed"):
+            # Chunks are streamed into the vector store batch by batch. Chunk IDs are
+            # content hashes, so chunks stored by an earlier upload or an interrupted
+            # attempt are skipped and only new or changed text is embedded.
+            report("embed", total_pages, total_pages)
+            databaseManager = DatabaseManager.get_instance()
+            databaseManager.register_file(filename, course)
+            existing_ids = databaseManager.get_ids(filename, course=course)
+            current_ids = set()
+            current_parents = set()
+            embedded = 0
+            token_stats = {}
+            dedup = ChunkDeduplicator(max_distance=dedup_max_distance, near=dedup_near) if dedup_enabled else None
+            for data, metadata, ids, parents in chunking_stream(content, filename, batch_size=chunk_batch_size,
+                                                                stats=token_stats, dedup=dedup):
+                # Sections go to the parent store before the chunks that point to them
+                databaseManager.parent_store.put_many(parents)
+                current_parents.update(parents)
+                embedded += databaseManager.sync_data(data, metadata, ids, existing_ids, course=course)
+                current_ids.update(ids)
+            if dedup is not None:
+                # Duplicates found after their original was stored add locations to it
+                databaseManager.update_metadata(*dedup.collapsed_metadata(), course=course)
+            databaseManager.delete_ids(existing_ids - current_ids, course=course)
+            databaseManager.parent_store.retain(filename, current_parents)
+            invalidate_answer_cache()
+            token_stats["embedded_chunks"] = embedded
+            checkpoint.complete("embed", token_stats=token_stats)
+
+        report("upload", total_pages, total_pages)
         minio_client.put_object(
             bucket_name=bucket_name,
             object_name=filename,
-            data=file_stream,
+            data=io.BytesIO(file_data),
             length=len(file_data),
             content_type='application/pdf'
         )
+        parse_stats = checkpoint.state.get("parse_stats")
+        token_stats = checkpoint.state.get("token_stats")
+        checkpoint.clear()
 
-        return {"message": f"Tạo thư mục {filename.replace('.pdf', '')} và lưu cơ sở dữ liệu thành công."}
+        return {"message": f"Tạo thư mục {filename.replace('.pdf', '')} và lưu cơ sở dữ liệu thành công.",
+                "parse_stats": parse_stats, "token_stats": token_stats}
 
     except Exception as e:
+        if is_retryable_error(e) and self.request.retries < self.max_retries:
+            print(f"Transient error while ingesting {filename} at stage {checkpoint.stage}, retrying: {e}")
+            raise self.retry(exc=e, countdown=min(300, 10 * 2 ** self.request.retries))
+        # No retry will resume from the checkpoint, so its pages must not pile up on disk
+        checkpoint.clear()
         return f"Error uploading file {filename}: {str(e)}"
 
 
@@ -77,8 +164,9 @@ def delete_pdf_and_images(filename: str):
     try:
         minio_client.remove_object(bucket_name, filename)
 
-        databaseManager = DatabaseManager()
+        databaseManager = DatabaseManager.get_instance()
         databaseManager.delete_data(filename=filename)
+        invalidate_answer_cache()
 
         return f"File {filename} và các ảnh liên quan đã được xóa thành công."
 
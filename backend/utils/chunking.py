@@ -1,11 +1,14 @@
+import hashlib
 import os
 import sys
 
-from datetime import datetime
 from dotenv import load_dotenv
 from langchain_text_splitters import MarkdownHeaderTextSplitter
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from utils.parent_store import ParentStore
+from utils.tokenizer import load_encoding
+
 
 class Chunking:
     def __init__(self, context="Trả lời bằng tiếng việt, đưa ra một đoạn tổng hợp ngắn."):
@@ -15,53 +18,110 @@ class Chunking:
         self.context = context
         self.chunk_size = int(os.environ.get('CHUNK_SIZE'))
         self.chunk_overlap = int(os.environ.get('CHUNK_OVERLAP'))
+        # "chars" keeps CHUNK_SIZE/CHUNK_OVERLAP in characters, "tokens" measures them with tiktoken
+        self.chunk_unit = os.environ.get('CHUNK_UNIT', 'chars')
+        self.encoding = load_encoding(os.environ.get('CHUNK_ENCODING', 'cl100k_base'))
+        self.token_stats = {}
 
-    def chunking_documents(self, document,filename):
-        """Read and split a Markdown document, then summarize each section."""
-        data = []
-        metadata = []
+    def _text_splitter(self):
+        separators = [
+            "\n\n",
+            "\n",
+            ".",
+        ]
+        if self.chunk_unit == "tokens":
+            return RecursiveCharacterTextSplitter(
+                separators=separators,
+                chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap,
+                length_function=lambda text: len(self.encoding.encode(text, disallowed_special=()))
+            )
+        return RecursiveCharacterTextSplitter(
+            separators=separators,
+            chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
+        )
+
+    @staticmethod
+    def chunk_id(filename, content, occurrence=0):
+        """Deterministic ID: the same chunk text in the same file always gets the same ID."""
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+        return f"{filename}_{digest}" if not occurrence else f"{filename}_{digest}_{occurrence}"
+
+    def iter_chunks(self, document, filename, dedup=None, parents=None):
+        """Yield (content, metadata, id) one chunk at a time, section by section.
 
-        
+        Consumers can start embedding the first chunks while later sections are
+        still being split. Once the generator is exhausted, token_stats holds the
+        token distribution of the chunks it produced. If dedup (a
+        ChunkDeduplicator) is given, repeated chunk text is only yielded once.
+        Every chunk's metadata carries the parent_id of its section; if parents
+        is a dict, section texts are added to it by parent_id (for the
+        ParentStore) instead of being copied into each chunk as raw_text.
+        """
         headers_to_split_on = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3"), ("####", "Header 4")]
         markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on)
         md_header_splits = markdown_splitter.split_text(document)
+        text_splitter = self._text_splitter()
+        occurrences = {}
+        header_order = ["Header 4", "Header 3", "Header 2", "Header 1"]
+        token_counts = []
+        self.token_stats = {}
 
-        text_splitter = RecursiveCharacterTextSplitter(
-            separators=[
-                "\n\n",
-                "\n",
-                ".",
-            ],
-            chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
-        )
-        splits = text_splitter.split_documents(md_header_splits)
-        for md_header_split in splits:
-            md_header_split.metadata["filename"]=filename
-        for md_header_split in splits:
-            content = md_header_split.page_content
-            mts = md_header_split.metadata
-            for document in md_header_splits:
-                text = document.page_content
-                if content in text:
-                    mts['raw_text'] = text
-                    break
-            header_order = ["Header 4", "Header 3", "Header 2", "Header 1"]
+        # Split section by section so every chunk knows its parent directly,
+        # instead of searching all sections for the one containing it.
+        for section in md_header_splits:
+            parent_id = ParentStore.parent_id(filename, section.page_content)
+            if parents is not None:
+                parents[parent_id] = section.page_content
+            for content in text_splitter.split_text(section.page_content):
+                mts = dict(section.metadata)
+                mts["filename"] = filename
+                mts["parent_id"] = parent_id
+                if parents is None:
+                    mts["raw_text"] = section.page_content
+                body = content
+
+                for header in header_order:
+                    if header in mts:
+                        content = f"Tiêu đề: {mts[header]} có nội dung là: {content}"
 
-            for header in header_order:
-                for item in mts:
-                    if header == item:
-                        content = f"Tiêu đề: {mts[item]} có nội dung là: {content}"
+                content = f"Tài liệu {filename} có nội dung là: {content}"
+                # summary_content = self._get_summary(content=content)
+                # mts['summary'] = summary_content
 
-            content = f"Tài liệu {filename} có nội dung là: {content}"
-            # summary_content = self._get_summary(content=content)
-            content_with_summary = f"{content}"
+                chunk_id = self.chunk_id(filename, content, occurrences.get(content, 0))
+                occurrences[content] = occurrences.get(content, 0) + 1
+                if dedup is not None and dedup.add(chunk_id, body, mts) is not None:
+                    continue
+                token_counts.append(len(self.encoding.encode(content, disallowed_special=())))
+                yield content, mts, chunk_id
 
-            data.append(content_with_summary)
-            # mts['summary'] = summary_content
+        self.token_stats = self._distribution(token_counts)
+        if dedup is not None:
+            self.token_stats.update(dedup.stats())
+        print(f"{filename}: token distribution {self.token_stats}")
 
+    @staticmethod
+    def _distribution(token_counts):
+        if not token_counts:
+            return {"chunks": 0}
+        counts = sorted(token_counts)
+        return {
+            "chunks": len(counts),
+            "total_tokens": sum(counts),
+            "min": counts[0],
+            "p50": counts[len(counts) // 2],
+            "p95": counts[min(len(counts) - 1, int(len(counts) * 0.95))],
+            "max": counts[-1],
+            "mean": round(sum(counts) / len(counts), 1),
+        }
+
+    def chunking_documents(self, document,filename):
+        """Read and split a Markdown document, then summarize each section."""
+        data = []
+        metadata = []
+        ids = []
+        for content, mts, chunk_id in self.iter_chunks(document, filename):
+            data.append(content)
             metadata.append(mts)
-        current_time = datetime.now().strftime("%Y%m%d%H%M%S")
-        ids = [f"{current_time}_{i}" for i in range(1, len(data) + 1)]
-        print(ids)
+            ids.append(chunk_id)
         return data, metadata, ids
-
@@ -1,97 +1,406 @@
 import os
+import re
 import sys
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 import chromadb
+from chromadb.config import Settings
+from chromadb.errors import NotFoundError
 from chromadb.utils import embedding_functions
 from dotenv import load_dotenv
 from constants.constants import DB_DIRECTORY
+from utils.embedding import EmbeddingPipeline
+from utils.embedding_backends import OpenAIEmbeddingBackend, create_embedding_backend
+from utils.embedding_cache import EmbeddingCache
+from utils.lexical_index import LexicalIndex
+from utils.parent_store import ParentStore
+from utils.quantized_index import QuantizedIndex
+from utils.retrieval_fusion import RetrievalFusion
+from utils.shard_registry import ShardRegistry
+
+
+def create_chroma_client(mode=None, path=DB_DIRECTORY):
+    """Create the Chroma client for CHROMA_MODE.
+
+    "persistent" opens the local directory in-process (single process only).
+    "http" talks to a Chroma server, so the API and every Celery worker can
+    read and write concurrently. The HTTP client keeps a keep-alive connection
+    pool; sharing one client per process (DatabaseManager.get_instance) means
+    every request reuses it.
+    """
+    mode = mode or os.environ.get('CHROMA_MODE', 'persistent')
+    if mode == 'http':
+        settings = Settings(
+            anonymized_telemetry=False,
+            chroma_http_max_connections=int(os.environ.get('CHROMA_HTTP_MAX_CONNECTIONS', 100)),
+            chroma_http_max_keepalive_connections=int(os.environ.get('CHROMA_HTTP_MAX_KEEPALIVE', 20)),
+            chroma_http_keepalive_secs=float(os.environ.get('CHROMA_HTTP_KEEPALIVE_SECS', 60)),
+        )
+        return chromadb.HttpClient(
+            host=os.environ.get('CHROMA_HOST', 'chroma'),
+            port=int(os.environ.get('CHROMA_PORT', 8000)),
+            ssl=os.environ.get('CHROMA_SSL', 'false').lower() == 'true',
+            settings=settings
+        )
+    if not os.path.exists(path):
+        os.mkdir(path)
+        print("Database directory created successfully.")
+    return chromadb.PersistentClient(path=path)
+
+
+class CollectionShard:
+    """One Chroma collection together with its lexical and quantized side indexes."""
+
+    def __init__(self, name, collection, lexical_enabled=True, quantized_mode=""):
+        self.name = name
+        self.collection = collection
+        self.lexical_index = LexicalIndex(name) if lexical_enabled else None
+        if self.lexical_index is not None:
+            self.lexical_index.sync(collection, force=True)
+        self.quantized_index = QuantizedIndex(name, mode=quantized_mode) if quantized_mode else None
+        if self.quantized_index is not None:
+            self.quantized_index.sync(collection, force=True)
+
 
 class DatabaseManager:
+    _instance = None
+    _instance_lock = threading.Lock()
+    shard_list_every = 30
+
+    @staticmethod
+    def get_instance():
+        """ Shared per-process manager: one Chroma client, embedding function and collection handle. """
+        if DatabaseManager._instance is None:
+            with DatabaseManager._instance_lock:
+                if DatabaseManager._instance is None:
+                    DatabaseManager._instance = DatabaseManager()
+        return DatabaseManager._instance
+
+    @staticmethod
+    def readiness() -> dict:
+        """Whether the shared manager is initialized and its collection answers."""
+        instance = DatabaseManager._instance
+        if instance is None:
+            return {"ready": False, "reason": "not initialized"}
+        try:
+            status = {"ready": True, "collection": instance.database_name, "chunks": instance.collection.count(),
+                      "shards": len(instance.shards), "parent_store": instance.parent_store.backend}
+            if instance.embedding_cache is not None:
+                status["embedding_cache"] = instance.embedding_cache.stats()
+            return status
+        except Exception as e:
+            return {"ready": False, "reason": str(e)}
+
     def __init__(self):
         """Initialize database parameters and setup embedding function."""
         load_dotenv()
         self.open_api_key = os.environ.get('OPENAI_API_KEY')
         self.database_name = os.environ['DATABASE_NAME']
-        self.database_dir = DB_DIRECTORY
+        self.database_dir = os.environ.get('CHROMA_PERSIST_DIR', DB_DIRECTORY)
         self.embedding_model = os.environ['OPENAI_EMBEDDINGMODEL']
-        self.embedding_func = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=self.open_api_key,
-            model_name=self.embedding_model
+        # Shortened text-embedding-3 vectors; they live in their own collection
+        # since Chroma cannot mix vector sizes, so documents must be re-ingested.
+        self.embedding_dimensions = int(os.environ.get('OPENAI_EMBEDDING_DIMENSIONS', 0)) or None
+        self.embedding_backend = create_embedding_backend(
+            model=self.embedding_model, api_key=self.open_api_key, dimensions=self.embedding_dimensions
+        )
+        if isinstance(self.embedding_backend, OpenAIEmbeddingBackend):
+            if self.embedding_dimensions:
+                self.database_name = f"{self.database_name}_d{self.embedding_dimensions}"
+            self.embedding_func = embedding_functions.OpenAIEmbeddingFunction(
+                api_key=self.open_api_key,
+                model_name=self.embedding_model,
+                dimensions=self.embedding_dimensions
+            )
+        else:
+            # Other vector spaces get their own collections; vectors are always
+            # passed explicitly, so Chroma needs no embedding function for them.
+            self.database_name = f"{self.database_name}_{self.embedding_backend.name}"
+            self.embedding_func = None
+        self.embedding_cache = (
+            EmbeddingCache() if os.environ.get('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true' else None
         )
+        self.embedding_pipeline = EmbeddingPipeline(self.embedding_backend, cache=self.embedding_cache)
+        self.fusion = RetrievalFusion()
+        self.parent_store = ParentStore()
+        self.registry = ShardRegistry()
+        self.lexical_enabled = os.environ.get('LEXICAL_INDEX_ENABLED', 'true').lower() == 'true'
+        self.quantized_mode = os.environ.get('QUANTIZED_INDEX', '')
+        self.shard_concurrency = int(os.environ.get('QUERY_SHARD_CONCURRENCY', 8))
         self.client = self._initialize_client()
-        self.collection = self._get_or_create_collection()
+        self.max_batch_size = self._max_batch_size()
+        self.shards = {}
+        self._shards_lock = threading.Lock()
+        self._shard_names = None
+        self._shard_names_at = 0.0
+        # Documents uploaded without a course live in the DATABASE_NAME collection
+        default = self.shard()
+        self.collection = default.collection
+        self.lexical_index = default.lexical_index
+        self.quantized_index = default.quantized_index
 
     def _initialize_client(self):
-        """Create the database directory if it doesn't exist and initialize Chroma client."""
-        if not os.path.exists(self.database_dir):
-            os.mkdir(self.database_dir)
-            print("Database directory created successfully.")
+        """Initialize the Chroma client (local directory or Chroma server, see CHROMA_MODE)."""
         print("create database")
 
-        return chromadb.PersistentClient(path=self.database_dir)
+        return create_chroma_client(path=self.database_dir)
 
-    def _get_or_create_collection(self):
+    def _max_batch_size(self):
+        """Largest number of records Chroma accepts in one write."""
+        try:
+            return self.client.get_max_batch_size()
+        except Exception:
+            return 5000
+
+    def _get_or_create_collection(self, name=None):
         """Retrieve or create the collection with the specified name and embedding function."""
         print("get or create collection")
         collection = self.client.get_or_create_collection(
-            name=self.database_name,
+            name=name or self.database_name,
             metadata={"hnsw:space": "cosine"},
             embedding_function=self.embedding_func
         )
 
         return collection
 
-    def add_data(self, data, metadata, ids_list):
-        """Add data and corresponding metadata to the collection."""
+    def shard_name(self, course=None) -> str:
+        """Collection name of a course: "<DATABASE_NAME>__<course slug>"."""
+        if not course:
+            return self.database_name
+        slug = unicodedata.normalize("NFKD", course.replace("đ", "d").replace("Đ", "D"))
+        slug = re.sub(r"[^a-z0-9]+", "-", slug.encode("ascii", "ignore").decode().lower()).strip("-")
+        return f"{self.database_name}__{slug or 'course'}"
+
+    def shard(self, course=None) -> CollectionShard:
+        """The shard of course, opening (and creating) its collection on first use. For ingestion only."""
+        return self._open_shard(self.shard_name(course))
+
+    def existing_shard(self, course=None):
+        """The shard of course if its collection exists, else None; never creates anything.
+
+        The read path uses this, since courses come from request bodies.
+        """
+        return self.existing_shard_by_name(self.shard_name(course))
+
+    def existing_shard_by_name(self, name):
+        try:
+            return self._open_shard(name, create=False)
+        except (NotFoundError, ValueError):
+            return None
+
+    def _open_shard(self, name, create=True) -> CollectionShard:
+        shard = self.shards.get(name)
+        if shard is None:
+            with self._shards_lock:
+                shard = self.shards.get(name)
+                if shard is None:
+                    collection = self._get_or_create_collection(name) if create else self.client.get_collection(
+                        name=name, embedding_function=self.embedding_func
+                    )
+                    shard = CollectionShard(name, collection,
+                                            lexical_enabled=self.lexical_enabled, quantized_mode=self.quantized_mode)
+                    self.shards[name] = shard
+                    if self._shard_names is not None and name not in self._shard_names:
+                        self._shard_names.append(name)
+        return shard
+
+    def all_shards(self):
+        """Every shard of this database, including course collections created by other processes."""
+        now = time.time()
+        if self._shard_names is None or now - self._shard_names_at > self.shard_list_every:
+            names = [getattr(collection, "name", collection) for collection in self.client.list_collections()]
+            self._shard_names = [name for name in names
+                                 if name == self.database_name or name.startswith(f"{self.database_name}__")]
+            self._shard_names_at = now
+        shards = [self.existing_shard_by_name(name) for name in self._shard_names]
+        return [shard for shard in shards if shard is not None]
+
+    def shard_for_file(self, filename) -> CollectionShard:
+        """Shard holding filename; the default shard if its course collection is gone."""
+        _, course = self.registry.get(filename)
+        return self.existing_shard(course) or self.shard()
+
+    def register_file(self, filename, course=None):
+        """Record the course of filename, removing its chunks from the shard it was in before."""
+        found, previous = self.registry.get(filename)
+        if found and self.shard_name(previous) != self.shard_name(course):
+            self.delete_data(filename, course=previous)
+        self.registry.set(filename, course)
+
+    def add_data(self, data, metadata, ids_list, course=None):
+        """Embed data with the batched pipeline and write it to the collection in bulk."""
         if not isinstance(data, list) or not isinstance(metadata, list):
             raise ValueError("Data and metadata should be lists.")
         print("begin add data")
+        shard = self.shard(course)
 
-        self.collection.add(documents=data, metadatas=metadata, ids=ids_list)
-        # batch_size = 1
-        # for i in range(0, len(data), batch_size):
-        #     batch_data = data[i:i + batch_size]
-        #     batch_metadata = metadata[i:i + batch_size]
-        #     batch_ids = id[i:i + batch_size]
-        #     self.collection.add(documents=batch_data, metadatas=batch_metadata, ids=batch_ids)
-        #     print(f"Added batch {i // batch_size + 1}")
+        embeddings = self.embedding_pipeline.embed(data)
+        for i in range(0, len(data), self.max_batch_size):
+            shard.collection.upsert(
+                ids=ids_list[i:i + self.max_batch_size],
+                embeddings=embeddings[i:i + self.max_batch_size],
+                documents=data[i:i + self.max_batch_size],
+                metadatas=metadata[i:i + self.max_batch_size]
+            )
+        if shard.lexical_index is not None:
+            shard.lexical_index.add(ids_list, data, metadata)
+        if shard.quantized_index is not None:
+            shard.quantized_index.add(ids_list, embeddings, metadata)
 
         print("Data added to the database successfully.")
 
+    def get_ids(self, filename, course=None) -> set:
+        """IDs of every chunk currently stored for filename."""
+        return set(self.shard(course).collection.get(where={"filename": filename}, include=[])['ids'])
+
+    def sync_data(self, data, metadata, ids_list, existing_ids: set, course=None):
+        """Embed and add only chunks whose ID is not stored yet.
+
+        Chunk IDs are content hashes, so a known ID means the text is unchanged;
+        for those only the metadata is refreshed, which needs no embedding call.
+        Returns the number of chunks that were embedded.
+        """
+        new = [i for i, chunk_id in enumerate(ids_list) if chunk_id not in existing_ids]
+        known = [i for i, chunk_id in enumerate(ids_list) if chunk_id in existing_ids]
+        if new:
+            self.add_data([data[i] for i in new], [metadata[i] for i in new], [ids_list[i] for i in new],
+                          course=course)
+        if known:
+            self.update_metadata([ids_list[i] for i in known], [metadata[i] for i in known], course=course)
+        return len(new)
+
+    def update_metadata(self, ids_list, metadata, course=None):
+        """Replace metadata of stored chunks without re-embedding them."""
+        if ids_list:
+            self.shard(course).collection.update(ids=ids_list, metadatas=metadata)
+
+    def delete_ids(self, ids_list, course=None):
+        if ids_list:
+            shard = self.shard(course)
+            shard.collection.delete(ids=list(ids_list))
+            if shard.lexical_index is not None:
+                shard.lexical_index.delete(list(ids_list))
+            if shard.quantized_index is not None:
+                shard.quantized_index.delete(list(ids_list))
+            print(f"Deleted {len(ids_list)} stale chunks.")
+
     def remove_database(self):
         """Remove the collection from the database."""
         self.client.delete_collection(name=self.database_name)
         print("Database collection removed successfully.")
-    def delete_data(self, filename):
-        self.collection.delete(where={"filename":filename})
-    def query_collection(self, questions: [str]) -> [str]:
-        """Get data from vector database"""
+    def delete_data(self, filename, course=None):
+        """Delete the chunks of filename from its shard (looked up in the registry unless course is given)."""
+        found, registered = self.registry.get(filename)
+        # A course without a collection has no chunks to delete; opening it would create it
+        shard = self.existing_shard(course if course is not None or not found else registered)
+        if shard is not None:
+            shard.collection.delete(where={"filename":filename})
+            if shard.lexical_index is not None:
+                shard.lexical_index.delete_file(filename)
+            if shard.quantized_index is not None:
+                shard.quantized_index.delete_file(filename)
+        if course is None or self.shard_name(course) == self.shard_name(registered):
+            self.parent_store.delete_file(filename)
+            self.registry.remove(filename)
+    def query_collection(self, questions: [str], lexical_queries: [str] = None, courses: [str] = None) -> [str]:
+        """Get data from vector database
+
+        Each question is searched by embedding (in Chroma, or in the quantized
+        index if QUANTIZED_INDEX is set); each lexical query (the questions by
+        default) is also searched in the BM25 index, and all ranked lists are
+        fused together. Only the shards of courses are searched, in parallel;
+        without courses every shard is.
+        """
         print('Get data from vector database')
-        collection_answer = self.collection.query(
-            query_texts=questions,
-            n_results=10,
-        )
+        include = ["documents", "metadatas", "distances"]
+        if self.fusion.use_mmr:
+            include.append("embeddings")
+        # Embedded through the pipeline so repeated sub-queries are served from the cache
+        query_embeddings = self.embedding_pipeline.embed(questions)
+        if courses:
+            # Unknown courses are skipped rather than created
+            shards = [shard for shard in map(self.existing_shard, dict.fromkeys(courses)) if shard is not None]
+        else:
+            shards = self.all_shards()
+        if not shards:
+            return []
+
+        def search(shard):
+            return self._search_shard(shard, questions, query_embeddings, lexical_queries or questions, include)
+
+        if len(shards) == 1:
+            answers = [search(shards[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.shard_concurrency, len(shards))) as executor:
+                answers = list(executor.map(search, shards))
+        # Every shard contributes its own ranked lists; fusion merges them all
+        collection_answer = {key: [row for answer in answers for row in answer[key]] for key in ["ids"] + include}
+        picked = self.fusion.select(collection_answer, self._parent_key)
+        return self._resolve_parents(picked)
+
+    def _search_shard(self, shard, questions, query_embeddings, lexical_queries, include):
+        ranked = []
+        if shard.quantized_index is not None:
+            shard.quantized_index.sync(shard.collection)
+            ranked.extend(shard.quantized_index.search(query_embeddings, shard.collection, k=self.fusion.top_k))
+            collection_answer = {key: [] for key in ["ids"] + include}
+        else:
+            collection_answer = shard.collection.query(
+                query_embeddings=query_embeddings,
+                n_results=self.fusion.top_k,
+                include=include
+            )
+        if shard.lexical_index is not None:
+            shard.lexical_index.sync(shard.collection)
+            for query in lexical_queries:
+                hits = shard.lexical_index.search(query, k=self.fusion.top_k)
+                if hits:
+                    best = hits[0][1] or 1.0
+                    # Scaled to pseudo cosine distances so QUERY_FUSION=score can mix them in too
+                    ranked.append([(chunk_id, 1.0 - score / best) for chunk_id, score in hits])
+        return self._add_ranked_results(shard.collection, collection_answer, ranked, include)
 
-        collection_documents = collection_answer['documents']
-        collection_distances = collection_answer['distances']
-        collection_id = collection_answer['ids']
-        collection_metadatas = collection_answer['metadatas']
-        documents = []
-
-        for i in range(len(questions)):
-            for j in range(len(collection_distances[0])):
-                documents.append({'id': collection_id[i][j], 'document': collection_documents[i][j],
-                                  'score': collection_distances[i][j], 'metadatas': collection_metadatas[i][j]})
-        documents_sorted = sorted(documents, key=lambda x: x['score'], reverse=False)
-        unique_docs = {}
+    @staticmethod
+    def _parent_key(document, metadata):
+        # Chunks stored before the parent store still carry their section inline
+        return metadata.get('parent_id') or metadata['raw_text']
+
+    def _resolve_parents(self, metadatas):
+        """Section texts of the picked chunks, fetched from the parent store in one batch."""
+        parents = self.parent_store.get_many(
+            [metadata['parent_id'] for metadata in metadatas if 'parent_id' in metadata and 'raw_text' not in metadata]
+        )
         top_documents = []
+        for metadata in metadatas:
+            text = metadata.get('raw_text') or parents.get(metadata.get('parent_id'))
+            if text is not None:
+                top_documents.append(text)
+        return top_documents
+
+    @staticmethod
+    def _add_ranked_results(collection, collection_answer, ranked, include):
+        """Append ranked [(chunk_id, distance)] lists to a Chroma query result.
+
+        Documents and metadata of all listed chunks are fetched in one get().
+        """
+        answer = {key: list(collection_answer[key]) for key in ["ids"] + include}
+        hit_ids = list(dict.fromkeys(chunk_id for row in ranked for chunk_id, _ in row))
+        if not hit_ids:
+            return answer
+        stored = collection.get(ids=hit_ids, include=[key for key in include if key != "distances"])
+        position = {chunk_id: i for i, chunk_id in enumerate(stored['ids'])}
 
-        for doc in documents_sorted:
-            if doc['id'] not in unique_docs:
-                unique_docs[doc['id']] = doc
-                if doc['metadatas']['raw_text'] not in top_documents:
-                    top_documents.append(doc['metadatas']['raw_text'])
-            if len(top_documents) == 20:
-                break
-        return top_documents
\ No newline at end of file
+        for row in ranked:
+            row = [(chunk_id, distance) for chunk_id, distance in row if chunk_id in position]
+            if not row:
+                continue
+            answer["ids"].append([chunk_id for chunk_id, _ in row])
+            answer["distances"].append([distance for _, distance in row])
+            for key in ("documents", "metadatas", "embeddings"):
+                if key in answer:
+                    answer[key].append([stored[key][position[chunk_id]] for chunk_id, _ in row])
+        return answer
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import re
+
+import numpy as np
+
+# "Trang 12", "page 3", "trang 3/120": page footers differ only by these
+PAGE_NUMBER = re.compile(r"\b(trang|page|tr\.)\s*\d+(\s*/\s*\d+)?", re.IGNORECASE)
+# A footer line starts or ends with its page number; "xem trang 12" inside a sentence is content
+FOOTER_LINE = re.compile(r"^\W*(trang|page|tr\.)\s*\d+|\b(trang|page|tr\.)\s*\d+(\s*/\s*\d+)?\W*$",
+                         re.IGNORECASE)
+NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+class ChunkDeduplicator:
+    """Collapse repeated chunks (footers, agenda slides, boilerplate) before they are embedded.
+
+    Exact copies are caught by a hash of the normalized text, in which page
+    numbers are masked on short lines that start or end with one ("Trang 12",
+    "Đề cương ôn tập - trang 3/120") so repeated footers match; a page
+    reference in running text ("xem trang 12") is kept. The first
+    occurrence is kept and its metadata lists every location the text
+    appeared at.
+
+    With near=True, near copies are also caught by a 64-bit SimHash over word
+    3-gram shingles. Fingerprints are split into 8 bands of 8 bits, so any
+    pair within max_distance <= 7 differing bits shares at least one band and
+    is found without comparing against every kept chunk; unrelated chunks sit
+    around 32 bits apart. Two chunks are only merged if they contain the same
+    numbers ("45 ngày" is not "30 ngày"), but a small wording change such as
+    "người lao động" / "người sử dụng lao động" can still be merged, and the
+    variant is then never embedded. That is why near dedup is opt-in.
+    """
+    bands = 8
+    min_words = 8
+    footer_max_words = 8
+
+    def __init__(self, max_distance=7, near=False):
+        self.max_distance = min(max_distance, self.bands - 1)
+        self.near = near
+        self.numbers = {}
+        self.exact = {}
+        self.band_index = {}
+        self.fingerprints = {}
+        self.kept_metadata = {}
+        self.locations = {}
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+    def normalize(self, text: str) -> str:
+        lines = []
+        for line in text.lower().splitlines():
+            if len(line.split()) <= self.footer_max_words and FOOTER_LINE.search(line):
+                line = PAGE_NUMBER.sub(r"\1 #", line)
+            lines.append(line)
+        return re.sub(r"\s+", " ", "\n".join(lines)).strip()
+
+    @staticmethod
+    def location(metadata: dict) -> str:
+        headers = [metadata[key] for key in ("Header 1", "Header 2", "Header 3", "Header 4") if key in metadata]
+        return " > ".join([metadata.get("filename", "")] + headers)
+
+    def simhash(self, words) -> int:
+        shingles = [" ".join(words[i:i + 3]) for i in range(len(words) - 2)]
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles],
+            dtype=np.uint64
+        )
+        bits = np.unpackbits(hashes.byteswap().view(np.uint8).reshape(-1, 8), axis=1)
+        weights = (2 * bits.astype(np.int32) - 1).sum(axis=0)
+        return int("".join("1" if w > 0 else "0" for w in weights), 2)
+
+    def _bands(self, fingerprint):
+        width = 64 // self.bands
+        return [(band, (fingerprint >> (band * width)) & ((1 << width) - 1)) for band in range(self.bands)]
+
+    def _find_near(self, fingerprint, numbers):
+        for key in self._bands(fingerprint):
+            for kept_id in self.band_index.get(key, ()):
+                if self.numbers[kept_id] != numbers:
+                    continue
+                if bin(fingerprint ^ self.fingerprints[kept_id]).count("1") <= self.max_distance:
+                    return kept_id
+        return None
+
+    def add(self, chunk_id: str, text: str, metadata: dict):
+        """Register a chunk. Returns the ID of the chunk it duplicates, or None if it should be kept."""
+        normalized = self.normalize(text)
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        words = normalized.split(" ")
+        fingerprint = self.simhash(words) if self.near and len(words) >= self.min_words else None
+        numbers = NUMBER.findall(normalized)
+
+        duplicate_of = self.exact.get(digest)
+        if duplicate_of is not None:
+            self.exact_duplicates += 1
+        elif fingerprint is not None:
+            duplicate_of = self._find_near(fingerprint, numbers)
+            if duplicate_of is not None:
+                self.near_duplicates += 1
+
+        if duplicate_of is not None:
+            location = self.location(metadata)
+            if location not in self.locations[duplicate_of]:
+                self.locations[duplicate_of].append(location)
+            kept = self.kept_metadata[duplicate_of]
+            kept["duplicate_count"] = kept.get("duplicate_count", 1) + 1
+            kept["locations"] = json.dumps(self.locations[duplicate_of], ensure_ascii=False)
+            return duplicate_of
+
+        self.exact[digest] = chunk_id
+        if fingerprint is not None:
+            self.fingerprints[chunk_id] = fingerprint
+            self.numbers[chunk_id] = numbers
+            for key in self._bands(fingerprint):
+                self.band_index.setdefault(key, []).append(chunk_id)
+        self.kept_metadata[chunk_id] = metadata
+        self.locations[chunk_id] = [self.location(metadata)]
+        return None
+
+    def collapsed_metadata(self):
+        """(ids, metadatas) of kept chunks that absorbed duplicates, to be written back after embedding."""
+        ids = [chunk_id for chunk_id, metadata in self.kept_metadata.items() if "duplicate_count" in metadata]
+        return ids, [self.kept_metadata[chunk_id] for chunk_id in ids]
+
+    def stats(self) -> dict:
+        return {
+            "kept_chunks": len(self.kept_metadata),
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates,
+        }
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.embedding_backends import EmbeddingBackend
+
+
+class TokenRateLimiter:
+    """Token bucket shared by the embedding threads of one process (tokens per minute)."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.tokens = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmbeddingPipeline:
+    """Embed texts in token-budgeted batches, several requests at a time.
+
+    Batches are packed up to EMBEDDING_BATCH_TOKENS tokens and
+    EMBEDDING_BATCH_SIZE inputs, sent EMBEDDING_CONCURRENCY at a time to the
+    backend (see utils.embedding_backends) and throttled by an optional
+    EMBEDDING_TPM budget. Texts found in the optional EmbeddingCache are not
+    sent at all.
+    """
+
+    def __init__(self, backend: EmbeddingBackend, cache=None):
+        self.backend = backend
+        self.cache = cache
+        self.batch_tokens = int(os.environ.get('EMBEDDING_BATCH_TOKENS', 100000))
+        self.batch_size = int(os.environ.get('EMBEDDING_BATCH_SIZE', 512))
+        self.concurrency = int(os.environ.get('EMBEDDING_CONCURRENCY', 4))
+        tokens_per_minute = int(os.environ.get('EMBEDDING_TPM', 0))
+        self.rate_limiter = TokenRateLimiter(tokens_per_minute) if tokens_per_minute else None
+
+    def pack_batches(self, token_counts):
+        """Group input indexes into batches that respect the token and input-count limits."""
+        batches, batch, batch_tokens = [], [], 0
+        for i, count in enumerate(token_counts):
+            if batch and (batch_tokens + count > self.batch_tokens or len(batch) >= self.batch_size):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(i)
+            batch_tokens += count
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_batch(self, texts, tokens):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(tokens)
+        return self.backend.embed_batch(texts)
+
+    def embed(self, texts):
+        """Embed texts and return the vectors in input order."""
+        if not texts:
+            return []
+        embeddings = [None] * len(texts)
+        keys = None
+        if self.cache is not None:
+            keys = [self.cache.make_key(text, self.backend.name) for text in texts]
+            cached = self.cache.get_many(keys)
+            for i, key in enumerate(keys):
+                embeddings[i] = cached.get(key)
+
+        # Embed each distinct missing text once, even if it repeats in the input
+        missing = {}
+        for i, text in enumerate(texts):
+            if embeddings[i] is None:
+                missing.setdefault(keys[i] if keys else text, []).append(i)
+        if not missing:
+            return embeddings
+        positions = list(missing.values())
+        prepared = [self.backend.prepare(texts[indexes[0]]) for indexes in positions]
+        batches = self.pack_batches([count for _, count in prepared])
+
+        def run(batch):
+            vectors = self._embed_batch([prepared[j][0] for j in batch], sum(prepared[j][1] for j in batch))
+            for j, vector in zip(batch, vectors):
+                for i in positions[j]:
+                    embeddings[i] = vector
+            if self.cache is not None:
+                self.cache.put_many([(keys[positions[j][0]], vector) for j, vector in zip(batch, vectors)])
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(run, batches))
+        print(f"Embedded {len(prepared)} of {len(texts)} texts in {len(batches)} batches, {time.time() - start:.1f}s")
+        return embeddings
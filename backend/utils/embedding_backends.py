@@ -0,0 +1,103 @@
+import hashlib
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+from utils.gpt_call import call_with_retry, get_openai_client
+from utils.tokenizer import load_encoding
+
+
+class EmbeddingBackend:
+    """Turns batches of texts into vectors for EmbeddingPipeline.
+
+    name identifies the vector space: it keys the embedding cache and
+    vectors from backends with different names must not share a collection.
+    """
+    name = ""
+    max_input_tokens = 8191
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+
+    def prepare(self, text: str):
+        """Return (text, token count), truncating inputs longer than the backend accepts."""
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) > self.max_input_tokens:
+            return self.encoding.decode(tokens[:self.max_input_tokens]), self.max_input_tokens
+        return text, max(1, len(tokens))
+
+    def embed_batch(self, texts):
+        raise NotImplementedError
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """OpenAI embeddings API, retried with backoff on 429/5xx."""
+
+    def __init__(self, model: str, api_key: str = None, dimensions: int = None):
+        super().__init__(load_encoding(model=model))
+        self.model = model
+        self.dimensions = dimensions
+        # Vectors of different sizes must not share cache entries
+        self.name = f"{model}@{dimensions}" if dimensions else model
+        self.client = get_openai_client(api_key)
+        self.max_retries = int(os.environ.get('OPENAI_MAX_RETRIES', 5))
+
+    def embed_batch(self, texts):
+        options = {"dimensions": self.dimensions} if self.dimensions else {}
+        response = call_with_retry(
+            lambda: self.client.embeddings.create(model=self.model, input=texts, **options),
+            max_retries=self.max_retries
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """Deterministic CPU embeddings from hashed words and character n-grams.
+
+    Needs no network or model files, so ingestion and retrieval can be run
+    and profiled offline. Texts sharing words and word fragments get close
+    vectors; it has no notion of synonyms, so use it for throughput and
+    latency measurements, not for judging answer quality.
+    """
+    ngram_sizes = (3, 4, 5)
+    max_input_tokens = 2048
+
+    def __init__(self, dimensions: int = 384):
+        super().__init__(load_encoding())
+        self.dimensions = dimensions
+        self.name = f"local-hash-{dimensions}"
+
+    def _features(self, text):
+        words = re.findall(r"\w+", unicodedata.normalize("NFC", text).lower())
+        features = list(words)
+        for word in words:
+            padded = f"<{word}>"
+            for size in self.ngram_sizes:
+                features.extend(padded[i:i + size] for i in range(len(padded) - size + 1))
+        return features
+
+    def embed_batch(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                # Low bits pick the dimension, one more bit the sign (signed feature hashing)
+                vectors[row, digest % self.dimensions] += 1.0 if (digest >> 32) & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).tolist()
+
+
+def create_embedding_backend(backend=None, model=None, api_key=None, dimensions=None) -> EmbeddingBackend:
+    """Backend selected by EMBEDDING_BACKEND: "openai" (default) or "local".
+
+    dimensions only applies to OpenAI; the local backend uses LOCAL_EMBEDDING_DIMENSIONS.
+    """
+    backend = backend or os.environ.get('EMBEDDING_BACKEND', 'openai')
+    if backend == 'local':
+        return HashingEmbeddingBackend(dimensions=int(os.environ.get('LOCAL_EMBEDDING_DIMENSIONS', 384)))
+    if backend == 'openai':
+        return OpenAIEmbeddingBackend(model=model, api_key=api_key, dimensions=dimensions)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
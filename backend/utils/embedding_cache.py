@@ -0,0 +1,126 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+from constants.constants import EMBEDDING_CACHE_PATH
+
+
+class EmbeddingCache:
+    """SQLite cache of embedding vectors keyed by normalized text and model.
+
+    Serves both ingestion (re-ingested chunks) and queries (repeated
+    sub-queries of popular questions). Vectors are stored as float32 blobs.
+    Once EMBEDDING_CACHE_MAX_BYTES is exceeded the least recently used
+    entries are evicted.
+    """
+    evict_every = 1000
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('EMBEDDING_CACHE_PATH', EMBEDDING_CACHE_PATH)
+        self.max_bytes = int(os.environ.get('EMBEDDING_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # One connection shared by the threads of this process; WAL lets the
+        # API and worker processes on the same host read while one writes.
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.connection.commit()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+    def make_key(self, text: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\0{self.normalize(text)}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys) -> dict:
+        """Return {key: vector} for the keys that are cached."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        try:
+            with self._lock:
+                for i in range(0, len(unique), 500):
+                    part = unique[i:i + 500]
+                    rows = self.connection.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                    ).fetchall()
+                    found.update((key, np.frombuffer(vector, dtype=np.float32).tolist()) for key, vector in rows)
+                if found:
+                    now = time.time()
+                    self.connection.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                    )
+                    self.connection.commit()
+        except sqlite3.Error as e:
+            print(f"Embedding cache read error: {e}")
+        with self._lock:
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items):
+        """Store (key, vector) pairs."""
+        now = time.time()
+        rows = []
+        for key, vector in items:
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((key, blob, len(blob), now))
+        if not rows:
+            return
+        try:
+            with self._lock:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)", rows
+                )
+                self.connection.commit()
+                self._writes += len(rows)
+                due = self._writes >= self.evict_every
+                if due:
+                    self._writes = 0
+            if due:
+                self.evict()
+        except sqlite3.Error as e:
+            print(f"Embedding cache write error: {e}")
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            removed = 0
+            rows = self.connection.execute("SELECT key, size FROM embeddings ORDER BY last_used").fetchall()
+            stale = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                stale.append((key,))
+                total -= size
+                removed += 1
+            self.connection.executemany("DELETE FROM embeddings WHERE key = ?", stale)
+            self.connection.commit()
+        print(f"Embedding cache: evicted {removed} entries, {total} bytes left")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -1,6 +1,100 @@
+import asyncio
 import os
+import random
+import threading
+import time
+import weakref
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import (AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI, APIConnectionError,
+                    APIStatusError, APITimeoutError, RateLimitError)
+
+_clients = {}
+# Per event loop, dropped with the loop
+_async_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.environ.get('OPENAI_MAX_CONNECTIONS', 200)),
+        max_keepalive_connections=int(os.environ.get('OPENAI_MAX_KEEPALIVE', 50)),
+        keepalive_expiry=float(os.environ.get('OPENAI_KEEPALIVE_SECS', 60)),
+    )
+
+
+def get_openai_client(api_key: str = None) -> OpenAI:
+    """Process-wide OpenAI client, so every caller shares one keep-alive connection pool."""
+    if not api_key:
+        load_dotenv()
+        api_key = os.environ.get('OPENAI_API_KEY')
+    # Forked Celery workers must not reuse sockets opened by the parent
+    key = (api_key, os.getpid())
+    with _clients_lock:
+        if key not in _clients:
+            # call_with_retry is the only retry layer; the SDK would retry each attempt twice more
+            _clients[key] = OpenAI(api_key=api_key, max_retries=0,
+                                   http_client=DefaultHttpxClient(limits=_http_limits()))
+        return _clients[key]
+
+
+def get_async_openai_client(api_key: str = None) -> AsyncOpenAI:
+    """AsyncOpenAI client shared by every coroutine on the running event loop.
+
+    httpx connections belong to the loop that opened them, so a new loop
+    (asyncio.run in a script or test) gets its own client.
+    """
+    if not api_key:
+        load_dotenv()
+        api_key = os.environ.get('OPENAI_API_KEY')
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        if api_key not in clients:
+            clients[api_key] = AsyncOpenAI(api_key=api_key, max_retries=0,
+                                           http_client=DefaultAsyncHttpxClient(limits=_http_limits()))
+        return clients[api_key]
+
+
+def is_retryable_error(err: Exception) -> bool:
+    """Rate limits, timeouts, dropped connections and 5xx are worth retrying."""
+    if isinstance(err, (RateLimitError, APITimeoutError, APIConnectionError)):
+        return True
+    if isinstance(err, APIStatusError):
+        return err.status_code == 429 or err.status_code >= 500
+    return False
+
+
+def call_with_retry(func, max_retries=5, base_delay=1.0, max_delay=30.0):
+    """Call func(), retrying retryable OpenAI errors with exponential backoff and jitter."""
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as err:
+            if attempt >= max_retries or not is_retryable_error(err):
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            print(f"OpenAI call failed ({err.__class__.__name__}), retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+async def acall_with_retry(func, max_retries=5, base_delay=1.0, max_delay=30.0):
+    """Async call_with_retry: awaits func() and sleeps without blocking the event loop."""
+    attempt = 0
+    while True:
+        try:
+            return await func()
+        except Exception as err:
+            if attempt >= max_retries or not is_retryable_error(err):
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            print(f"OpenAI call failed ({err.__class__.__name__}), retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
 
 
 class ChatGPTGen:
@@ -8,8 +102,10 @@ class ChatGPTGen:
         load_dotenv()
 
         self.open_api_key = os.environ.get('OPENAI_API_KEY')
-        self.client = OpenAI(api_key=self.open_api_key)
+        # Cheap to create: the HTTP connection pools are shared per process
+        self.client = get_openai_client(self.open_api_key)
         self.model = os.environ.get('OPENAI_MODEL')
+        self.max_retries = int(os.environ.get('OPENAI_MAX_RETRIES', 5))
 
     def default_chat_completion(self, messages: [], token_output=4085) -> str:
         completion = self.client.chat.completions.create(
@@ -19,13 +115,56 @@ class ChatGPTGen:
         )
         return completion.choices[0].message.content
 
+    def retry_chat_completion(self, messages: [], token_output=4085) -> str:
+        """Same as default_chat_completion, but retries on 429/5xx with backoff."""
+        return call_with_retry(
+            lambda: self.default_chat_completion(messages, token_output=token_output),
+            max_retries=self.max_retries
+        )
+
     def stream_chat_completion(self, messages: []):
+        # Only opening the stream is retried, a reply cut off mid-way cannot be resumed
+        completion = call_with_retry(
+            lambda: self.client.chat.completions.create(model=self.model, messages=messages, stream=True),
+            max_retries=self.max_retries
+        )
+        for chunk in completion:
+            if chunk.choices[0].delta.content is not None:
+                yield chunk.choices[0].delta.content
 
-        completion = self.client.chat.completions.create(
+    @property
+    def aclient(self) -> AsyncOpenAI:
+        return get_async_openai_client(self.open_api_key)
+
+    async def adefault_chat_completion(self, messages: [], token_output=4085) -> str:
+        completion = await self.aclient.chat.completions.create(
             model=self.model,
             messages=messages,
-            stream=True
+            max_tokens=token_output
         )
-        for chunk in completion:
-            if chunk.choices[0].delta.content is not None:
-                yield chunk.choices[0].delta.content
\ No newline at end of file
+        return completion.choices[0].message.content
+
+    async def aretry_chat_completion(self, messages: [], token_output=4085) -> str:
+        """Same as adefault_chat_completion, but retries on 429/5xx without blocking the event loop."""
+        return await acall_with_retry(
+            lambda: self.adefault_chat_completion(messages, token_output=token_output),
+            max_retries=self.max_retries
+        )
+
+    async def astream_chat_completion(self, messages: [], usage: dict = None):
+        """Yield the answer text; if usage is a dict it receives the token counts at the end."""
+        options = {"stream_options": {"include_usage": True}} if usage is not None else {}
+        completion = await acall_with_retry(
+            lambda: self.aclient.chat.completions.create(model=self.model, messages=messages, stream=True, **options),
+            max_retries=self.max_retries
+        )
+        try:
+            async for chunk in completion:
+                if usage is not None and getattr(chunk, "usage", None) is not None:
+                    usage.update(prompt_tokens=chunk.usage.prompt_tokens,
+                                 completion_tokens=chunk.usage.completion_tokens)
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Release the pooled connection when the client disconnects mid-answer
+            await completion.close()
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from constants.constants import CHECKPOINT_DIRECTORY
+
+
+class IngestCheckpoint:
+    """On-disk progress of one PDF ingestion, so a retried task resumes where it stopped.
+
+    Layout of <CHECKPOINT_DIR>/<job_key>/:
+        state.json   current stage, page counts and stage outputs
+        pages/N.md   markdown of every page transcribed so far
+    """
+    stages = ["parse", "write_txt", "embed", "upload", "done"]
+
+    def __init__(self, file_data: bytes, filename: str):
+        digest = hashlib.sha256(file_data).hexdigest()[:16]
+        self.job_key = f"{os.path.basename(filename).replace('.pdf', '')}_{digest}"
+        self.job_dir = os.path.join(os.environ.get('CHECKPOINT_DIR', CHECKPOINT_DIRECTORY), self.job_key)
+        self.pages_dir = os.path.join(self.job_dir, "pages")
+        self._lock = threading.Lock()
+        os.makedirs(self.pages_dir, exist_ok=True)
+        self.state = self._read_json("state.json") or {"stage": "parse", "filename": filename}
+
+    def _read_json(self, name):
+        path = os.path.join(self.job_dir, name)
+        if not os.path.isfile(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_json(self, name, value):
+        path = os.path.join(self.job_dir, name)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+    @property
+    def stage(self):
+        return self.state["stage"]
+
+    def reached(self, stage) -> bool:
+        """True if stage has already been completed by an earlier attempt."""
+        return self.stages.index(self.stage) > self.stages.index(stage)
+
+    def complete(self, stage, **outputs):
+        """Mark stage as done, storing any small outputs the next stages need."""
+        with self._lock:
+            self.state.update(outputs)
+            self.state["stage"] = self.stages[self.stages.index(stage) + 1]
+            self._write_json("state.json", self.state)
+
+    def load_pages(self) -> dict:
+        pages = {}
+        for name in os.listdir(self.pages_dir):
+            if name.endswith(".md"):
+                with open(os.path.join(self.pages_dir, name), "r", encoding="utf-8") as f:
+                    pages[int(name[:-3])] = f.read()
+        return pages
+
+    def save_page(self, page_num: int, content: str):
+        path = os.path.join(self.pages_dir, f"{page_num}.md")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(f"{path}.tmp", path)
+
+    def clear(self):
+        shutil.rmtree(self.job_dir, ignore_errors=True)
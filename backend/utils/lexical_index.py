@@ -0,0 +1,146 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from constants.constants import LEXICAL_INDEX_DIRECTORY
+
+
+class LexicalIndex:
+    """BM25 keyword index over the chunks of the Chroma collection (SQLite FTS5).
+
+    Vietnamese words are mostly written as space-separated syllables, so
+    every chunk is indexed twice: as lower-cased syllables and as syllable
+    bigrams ("điều_5", "quy_định"), which stand in for two-syllable words
+    and make references like "Điều 5" match as a unit. Bigram matches are
+    weighted higher. The index file is shared by the API and worker
+    processes and is updated whenever chunks are added or deleted.
+    """
+    bigram_weight = 2.0
+    sync_every = 60
+
+    def __init__(self, name, directory=None):
+        directory = directory or os.environ.get('LEXICAL_INDEX_DIR', LEXICAL_INDEX_DIRECTORY)
+        # One file per collection
+        self.path = os.path.join(directory, f"{name}.sqlite3")
+        self._lock = threading.Lock()
+        self._last_sync = 0.0
+        self._mismatch = None
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # chunk_ids maps Chroma IDs to FTS rowids so updates and deletes are index lookups
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_ids (rowid INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, filename TEXT)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS chunk_ids_filename ON chunk_ids (filename)")
+        self.connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+            "syllables, words, tokenize = \"unicode61 remove_diacritics 0 tokenchars '_'\")"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def tokenize(text: str):
+        return re.findall(r"\w+", unicodedata.normalize("NFC", text).lower().replace("_", " "))
+
+    @staticmethod
+    def bigrams(tokens):
+        return [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+    def _delete_rows(self, rowids):
+        self.connection.executemany("DELETE FROM chunks WHERE rowid = ?", rowids)
+        self.connection.executemany("DELETE FROM chunk_ids WHERE rowid = ?", rowids)
+
+    def _rowids(self, ids):
+        rowids = []
+        for chunk_id in ids:
+            row = self.connection.execute("SELECT rowid FROM chunk_ids WHERE id = ?", (chunk_id,)).fetchone()
+            if row is not None:
+                rowids.append(row)
+        return rowids
+
+    def add(self, ids, documents, metadatas):
+        """Index chunks, replacing any previous entry with the same ID."""
+        with self._lock:
+            self._delete_rows(self._rowids(ids))
+            for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                tokens = self.tokenize(document)
+                cursor = self.connection.execute(
+                    "INSERT INTO chunk_ids (id, filename) VALUES (?, ?)",
+                    (chunk_id, (metadata or {}).get("filename", ""))
+                )
+                self.connection.execute(
+                    "INSERT INTO chunks (rowid, syllables, words) VALUES (?, ?, ?)",
+                    (cursor.lastrowid, " ".join(tokens), " ".join(self.bigrams(tokens)))
+                )
+            self.connection.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            self._delete_rows(self._rowids(ids))
+            self.connection.commit()
+
+    def delete_file(self, filename):
+        with self._lock:
+            self._delete_rows(
+                self.connection.execute("SELECT rowid FROM chunk_ids WHERE filename = ?", (filename,)).fetchall()
+            )
+            self.connection.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM chunk_ids").fetchone()[0]
+
+    def search(self, query: str, k: int = 10):
+        """Return [(chunk_id, bm25 score)] best first (higher is better)."""
+        tokens = self.tokenize(query)
+        if not tokens:
+            return []
+        terms = [f'syllables : "{token}"' for token in dict.fromkeys(tokens)]
+        terms += [f'words : "{bigram}"' for bigram in dict.fromkeys(self.bigrams(tokens))]
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT chunk_ids.id, bm25(chunks, 1.0, ?) AS score FROM chunks "
+                "JOIN chunk_ids ON chunk_ids.rowid = chunks.rowid WHERE chunks MATCH ? ORDER BY score LIMIT ?",
+                (self.bigram_weight, " OR ".join(terms), k)
+            ).fetchall()
+        # FTS5 reports BM25 negated so that ascending order is best first
+        return [(chunk_id, -score) for chunk_id, score in rows]
+
+    def sync(self, collection, force=False):
+        """Rebuild from the collection if the chunk counts disagree.
+
+        Covers chunks stored before the index existed or written by a
+        process that does not share the index file. Checked at most every
+        sync_every seconds unless force is set; a mismatch has to be seen by
+        two checks in a row, so an ingestion caught between its Chroma write
+        and its index write does not trigger a rebuild.
+        """
+        now = time.time()
+        if not force and now - self._last_sync < self.sync_every:
+            return
+        self._last_sync = now
+        counts = (collection.count(), self.count())
+        if counts[0] == counts[1]:
+            self._mismatch = None
+            return
+        if not force and counts != self._mismatch:
+            self._mismatch = counts
+            return
+        self._mismatch = None
+        start = time.time()
+        with self._lock:
+            self.connection.execute("DELETE FROM chunks")
+            self.connection.execute("DELETE FROM chunk_ids")
+            self.connection.commit()
+        offset, page = 0, 1000
+        while True:
+            result = collection.get(include=["documents", "metadatas"], limit=page, offset=offset)
+            if not result['ids']:
+                break
+            self.add(result['ids'], result['documents'], result['metadatas'])
+            offset += len(result['ids'])
+        print(f"Lexical index rebuilt with {offset} chunks in {time.time() - start:.1f}s")
@@ -0,0 +1,60 @@
+"""Copy the persistent Chroma collections into a Chroma server, once, before switching to CHROMA_MODE=http.
+
+Usage (from backend/, with the chroma service running):
+    python -m utils.migrate_chroma [--source chromadb] [--host chroma] [--port 8000] [--batch 1000]
+
+Every collection of the local directory is copied with its IDs, stored
+embeddings, documents and metadata, so nothing is embedded again. Chunks
+already on the server are overwritten (upsert), so the copy can be re-run
+after an interruption. The lexical and quantized side indexes and the shard
+registry are keyed by collection name and stay valid; a local parent store
+is not moved, so keep PARENT_STORE_BACKEND=local when switching.
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import chromadb
+from dotenv import load_dotenv
+
+from constants.constants import DB_DIRECTORY
+
+
+def copy_collection(source, target, batch):
+    copied, offset = 0, 0
+    while True:
+        result = source.get(include=["embeddings", "documents", "metadatas"], limit=batch, offset=offset)
+        if not len(result['ids']):
+            return copied
+        target.upsert(ids=result['ids'], embeddings=result['embeddings'], documents=result['documents'],
+                      metadatas=result['metadatas'])
+        copied += len(result['ids'])
+        offset += len(result['ids'])
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default=os.environ.get('CHROMA_PERSIST_DIR', DB_DIRECTORY))
+    parser.add_argument("--host", default=os.environ.get('CHROMA_HOST', 'chroma'))
+    parser.add_argument("--port", type=int, default=int(os.environ.get('CHROMA_PORT', 8000)))
+    parser.add_argument("--ssl", action="store_true", default=os.environ.get('CHROMA_SSL', 'false').lower() == 'true')
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.source):
+        sys.exit(f"No persistent Chroma directory at {args.source}")
+    source = chromadb.PersistentClient(path=args.source)
+    target = chromadb.HttpClient(host=args.host, port=args.port, ssl=args.ssl)
+    for collection in source.list_collections():
+        # Vectors are passed explicitly, so neither side needs an embedding function
+        source_collection = source.get_collection(collection.name, embedding_function=None)
+        target_collection = target.get_or_create_collection(collection.name, metadata=collection.metadata,
+                                                            embedding_function=None)
+        copied = copy_collection(source_collection, target_collection, args.batch)
+        print(f"{collection.name}: copied {copied} chunks, server now has {target_collection.count()}")
+
+
+if __name__ == "__main__":
+    main()
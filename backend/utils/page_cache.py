@@ -0,0 +1,137 @@
+import hashlib
+import io
+import os
+import threading
+
+from constants.constants import BUCKET_NAME_PAGE_CACHE, PAGE_CACHE_DIRECTORY
+
+
+class PageCache:
+    """Content-addressed cache of per-page transcriptions.
+
+    Keys are a hash of the rendered page plus the prompt and model, so a page
+    is only sent to the vision model again when its pixels, the prompt or the
+    model change. Entries live on local disk or in MinIO (PAGE_CACHE_BACKEND).
+    Once PAGE_CACHE_MAX_BYTES is exceeded the least recently used entries
+    (oldest written, for MinIO) are evicted.
+    """
+    version = "v1"
+
+    def __init__(self):
+        self.backend = os.environ.get('PAGE_CACHE_BACKEND', 'local')
+        self.max_bytes = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+        self.cache_dir = os.environ.get('PAGE_CACHE_DIR', PAGE_CACHE_DIRECTORY)
+        self.bucket_name = BUCKET_NAME_PAGE_CACHE
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.backend == 'minio':
+            from config.minio_client import minio_client
+            self.minio_client = minio_client
+            if not minio_client.bucket_exists(self.bucket_name):
+                minio_client.make_bucket(self.bucket_name)
+        else:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, image_base64: str, prompt: str, model: str) -> str:
+        digest = hashlib.sha256()
+        for part in (self.version, model or "", prompt, image_base64):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.md")
+
+    def get(self, key: str):
+        """Return the cached markdown for key, or None."""
+        content = None
+        try:
+            if self.backend == 'minio':
+                response = self.minio_client.get_object(self.bucket_name, f"{key}.md")
+                try:
+                    content = response.read().decode("utf-8")
+                finally:
+                    response.close()
+                    response.release_conn()
+            else:
+                path = self._path(key)
+                with open(path, "r", encoding="utf-8") as f:
+                    content = f.read()
+                # Bump mtime so eviction treats the entry as recently used
+                os.utime(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            if "NoSuchKey" not in str(e):
+                print(f"Page cache read error: {e}")
+
+        with self._lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return content
+
+    def put(self, key: str, content: str):
+        data = content.encode("utf-8")
+        try:
+            if self.backend == 'minio':
+                self.minio_client.put_object(
+                    bucket_name=self.bucket_name,
+                    object_name=f"{key}.md",
+                    data=io.BytesIO(data),
+                    length=len(data),
+                    content_type="text/markdown"
+                )
+            else:
+                path = self._path(key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Page cache write error: {e}")
+
+    def _entries(self):
+        """Return (last_used, size, name) for every entry."""
+        if self.backend == 'minio':
+            return [(obj.last_modified.timestamp(), obj.size, obj.object_name)
+                    for obj in self.minio_client.list_objects(self.bucket_name, recursive=True)]
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".md"):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        return entries
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        try:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                if self.backend == 'minio':
+                    self.minio_client.remove_object(self.bucket_name, name)
+                else:
+                    os.remove(name)
+                total -= size
+                removed += 1
+            if removed:
+                print(f"Page cache: evicted {removed} entries, {total} bytes left")
+        except Exception as e:
+            print(f"Page cache eviction error: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
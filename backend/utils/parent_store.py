@@ -0,0 +1,152 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from constants.constants import BUCKET_NAME_PARENTS, PARENT_STORE_DIRECTORY
+
+
+class ParentStore:
+    """Full section texts that chunks point to through metadata['parent_id'].
+
+    Each section is stored once (local disk or MinIO, PARENT_STORE_BACKEND;
+    MinIO by default when CHROMA_MODE=http) instead of being copied into the
+    metadata of every chunk cut from it.
+    IDs are "<file key>_<text hash>", and sections are grouped per file so
+    a file's sections can be listed and removed together. Recently read
+    sections are kept in an in-memory LRU of PARENT_CACHE_SIZE entries.
+    """
+
+    def __init__(self):
+        # With a Chroma server the API and workers may not share a disk, so sections go to MinIO
+        default_backend = 'minio' if os.environ.get('CHROMA_MODE', 'persistent') == 'http' else 'local'
+        self.backend = os.environ.get('PARENT_STORE_BACKEND', default_backend)
+        self.store_dir = os.environ.get('PARENT_STORE_DIR', PARENT_STORE_DIRECTORY)
+        self.cache_size = int(os.environ.get('PARENT_CACHE_SIZE', 1024))
+        self.bucket_name = BUCKET_NAME_PARENTS
+        self.cache = OrderedDict()
+        self._lock = threading.Lock()
+        if self.backend == 'minio':
+            from config.minio_client import minio_client
+            self.minio_client = minio_client
+            if not minio_client.bucket_exists(self.bucket_name):
+                minio_client.make_bucket(self.bucket_name)
+        else:
+            os.makedirs(self.store_dir, exist_ok=True)
+
+    @staticmethod
+    def file_key(filename: str) -> str:
+        return hashlib.sha256(filename.encode("utf-8")).hexdigest()[:12]
+
+    @staticmethod
+    def parent_id(filename: str, text: str) -> str:
+        return f"{ParentStore.file_key(filename)}_{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+
+    def _name(self, parent_id):
+        file_key, digest = parent_id.split("_", 1)
+        return f"{file_key}/{digest}.md"
+
+    def _remember(self, parent_id, text):
+        with self._lock:
+            self.cache[parent_id] = text
+            self.cache.move_to_end(parent_id)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def _read(self, parent_id):
+        try:
+            if self.backend == 'minio':
+                response = self.minio_client.get_object(self.bucket_name, self._name(parent_id))
+                try:
+                    return response.read().decode("utf-8")
+                finally:
+                    response.close()
+                    response.release_conn()
+            with open(os.path.join(self.store_dir, self._name(parent_id)), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            if "NoSuchKey" not in str(e):
+                print(f"Parent store read error: {e}")
+            return None
+
+    def _write(self, parent_id, text):
+        data = text.encode("utf-8")
+        if self.backend == 'minio':
+            self.minio_client.put_object(
+                bucket_name=self.bucket_name,
+                object_name=self._name(parent_id),
+                data=io.BytesIO(data),
+                length=len(data),
+                content_type="text/markdown"
+            )
+            return
+        path = os.path.join(self.store_dir, self._name(parent_id))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put_many(self, parents: dict):
+        """Store {parent_id: text}."""
+        if not parents:
+            return
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda item: self._write(*item), parents.items()))
+        for parent_id, text in parents.items():
+            self._remember(parent_id, text)
+
+    def get_many(self, parent_ids) -> dict:
+        """Return {parent_id: text} for the IDs that exist, reading misses in parallel."""
+        found, missing = {}, []
+        with self._lock:
+            for parent_id in dict.fromkeys(parent_ids):
+                if parent_id in self.cache:
+                    self.cache.move_to_end(parent_id)
+                    found[parent_id] = self.cache[parent_id]
+                else:
+                    missing.append(parent_id)
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(8, len(missing))) as executor:
+                for parent_id, text in zip(missing, executor.map(self._read, missing)):
+                    if text is not None:
+                        found[parent_id] = text
+                        self._remember(parent_id, text)
+        return found
+
+    def _list_file(self, filename):
+        file_key = self.file_key(filename)
+        if self.backend == 'minio':
+            return [f"{file_key}_{os.path.basename(obj.object_name)[:-3]}"
+                    for obj in self.minio_client.list_objects(self.bucket_name, prefix=f"{file_key}/")]
+        file_dir = os.path.join(self.store_dir, file_key)
+        if not os.path.isdir(file_dir):
+            return []
+        return [f"{file_key}_{name[:-3]}" for name in os.listdir(file_dir) if name.endswith(".md")]
+
+    def _remove(self, parent_id):
+        with self._lock:
+            self.cache.pop(parent_id, None)
+        if self.backend == 'minio':
+            self.minio_client.remove_object(self.bucket_name, self._name(parent_id))
+        else:
+            try:
+                os.remove(os.path.join(self.store_dir, self._name(parent_id)))
+            except FileNotFoundError:
+                pass
+
+    def retain(self, filename, parent_ids):
+        """Remove the sections of filename that are not in parent_ids."""
+        keep = set(parent_ids)
+        stale = [parent_id for parent_id in self._list_file(filename) if parent_id not in keep]
+        for parent_id in stale:
+            self._remove(parent_id)
+        if stale:
+            print(f"Removed {len(stale)} stale sections of {filename}.")
+
+    def delete_file(self, filename):
+        self.retain(filename, ())
@@ -1,3 +1,4 @@
+import os
 import fitz
 from PIL import Image
 import io
@@ -6,7 +7,9 @@ from io import BytesIO
 import requests
 import time
 import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from utils.gpt_call import ChatGPTGen
+from utils.page_cache import PageCache
 
 class ParseHandler():
     _instance = None
@@ -32,60 +35,315 @@ class ParseHandler():
 
     def __init__(self, api_key) -> None:
         self.api_key = api_key
+        self.max_concurrency = int(os.environ.get('PARSE_CONCURRENCY', 8))
+        self.max_in_flight = int(os.environ.get('PARSE_QUEUE_SIZE', 2 * self.max_concurrency))
+        self.min_text_chars = int(os.environ.get('PARSE_MIN_TEXT_CHARS', 80))
+        self.max_image_ratio = float(os.environ.get('PARSE_MAX_IMAGE_RATIO', 0.5))
+        self.image_format = os.environ.get('PARSE_IMAGE_FORMAT', 'jpeg').lower()
+        self.image_quality = int(os.environ.get('PARSE_IMAGE_QUALITY', 80))
+        self.image_max_bytes = int(os.environ.get('PARSE_IMAGE_MAX_BYTES', 400 * 1024))
+        self.image_max_side = int(os.environ.get('PARSE_IMAGE_MAX_SIDE', 768))
+        self.image_min_side = int(os.environ.get('PARSE_IMAGE_MIN_SIDE', 512))
+        self.page_cache = PageCache() if os.environ.get('PAGE_CACHE_ENABLED', 'true').lower() == 'true' else None
+        self.last_parse_stats = {}
 
-    def pdf_to_images(self, file_stream, pdf_path, zoom_x=2.0, zoom_y=2.0):
+    def iter_page_images(self, file_stream, zoom_x=None, zoom_y=None, skip_pages=None):
+        """Render pages one at a time and yield (page_num, "image", data URL) without keeping earlier pages.
+
+        Without an explicit zoom each page goes through encode_page (adaptive
+        resolution, JPEG/WebP, byte cap); with one it is rendered as PNG at that zoom.
+        Pages in skip_pages (e.g. already checkpointed) are not rendered.
+        """
         pdf_document = fitz.open(stream=file_stream, filetype="pdf")
-        images = []
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            mat = fitz.Matrix(zoom_x, zoom_y)
-            pix = page.get_pixmap(matrix=mat)
-            img = Image.open(io.BytesIO(pix.tobytes("png")))
-            images.append(img)
-        image_base64s = []
-
-        for image in images:
+        try:
+            for page_num in range(len(pdf_document)):
+                if skip_pages and page_num in skip_pages:
+                    continue
+                page = pdf_document.load_page(page_num)
+                if zoom_x is None:
+                    yield page_num, "image", self.encode_page(page)
+                else:
+                    yield page_num, "image", self.render_png(page, zoom_x, zoom_y or zoom_x)
+        finally:
+            pdf_document.close()
+
+    @staticmethod
+    def render_png(page, zoom_x, zoom_y):
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom_x, zoom_y))
+        return "data:image/png;base64," + base64.b64encode(pix.tobytes("png")).decode("utf-8")
+
+    def page_zoom(self, page):
+        """Pick a zoom so the short side matches what the page's content density needs.
+
+        The vision model downsizes high-detail images to 768px on the short
+        side, so rendering beyond that only inflates the upload. Sparse pages
+        (slides, large fonts) are readable at image_min_side.
+        """
+        short_side = min(page.rect.width, page.rect.height) or 1
+        text_chars = 0
+        font_sizes = []
+        for block in page.get_text("dict")["blocks"]:
+            if block["type"] != 0:
+                continue
+            for line in block["lines"]:
+                for span in line["spans"]:
+                    if span["text"].strip():
+                        text_chars += len(span["text"])
+                        font_sizes.append(span["size"])
+        font_sizes.sort()
+        small_font = font_sizes[len(font_sizes) // 2] < 10 if font_sizes else False
+        dense = text_chars > 1500 or small_font or len(page.get_drawings()) > 200
+        # Scanned pages have no text layer to judge by, treat them as dense
+        if not font_sizes and page.get_image_info():
+            dense = True
+        target_side = self.image_max_side if dense else self.image_min_side
+        return max(0.5, min(2.0, target_side / short_side))
+
+    def encode_page(self, page):
+        """Render a page at an adaptive resolution and encode it as a JPEG/WebP data URL under image_max_bytes."""
+        zoom = self.page_zoom(page)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        del pix
+        image_format = "WEBP" if self.image_format == "webp" else "JPEG"
+        quality = self.image_quality
+        while True:
             buffered = BytesIO()
-            image.save(buffered, format="PNG")
+            image.save(buffered, format=image_format, quality=quality)
             image_bytes = buffered.getvalue()
-            image_base64s.append(base64.b64encode(image_bytes).decode("utf-8"))
-        print("số trang: ",len(image_base64s))
-        return image_base64s
-
-    def parse_pdf(self, image_base64s, file_name):
-        chatGPTGen=ChatGPTGen()
-        content=""
-        for i in range(0, len(image_base64s)):
-            messages=[
-                    {
-                        "role": "system",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": self.prompt_system
-                            },
-                        ]
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Transcribe the content from this image into markdown format"
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_base64s[i]}"
-                                }
+            if len(image_bytes) <= self.image_max_bytes:
+                break
+            if quality > 50:
+                quality -= 10
+            elif min(image.size) > 384:
+                image = image.resize((int(image.width * 0.85), int(image.height * 0.85)), Image.LANCZOS)
+            else:
+                break
+        mime = "image/webp" if image_format == "WEBP" else "image/jpeg"
+        return f"data:{mime};base64," + base64.b64encode(image_bytes).decode("utf-8")
+
+    def iter_pages(self, file_stream, mode="vision", zoom_x=None, zoom_y=None, skip_pages=None):
+        """Yield (page_num, kind, payload) for every page.
+
+        In "vision" mode every page is rendered for the vision model. In "hybrid"
+        mode pages with a usable text layer are converted to markdown locally
+        (kind "markdown") and only scanned/image-only pages are rendered (kind "image").
+        """
+        if mode != "hybrid":
+            yield from self.iter_page_images(file_stream, zoom_x, zoom_y, skip_pages)
+            return
+        pdf_document = fitz.open(stream=file_stream, filetype="pdf")
+        local_pages = 0
+        try:
+            for page_num in range(len(pdf_document)):
+                if skip_pages and page_num in skip_pages:
+                    continue
+                page = pdf_document.load_page(page_num)
+                if self.classify_page(page) == "text":
+                    local_pages += 1
+                    yield page_num, "markdown", self.page_to_markdown(page)
+                    continue
+                if zoom_x is None:
+                    yield page_num, "image", self.encode_page(page)
+                else:
+                    yield page_num, "image", self.render_png(page, zoom_x, zoom_y or zoom_x)
+            print(f"hybrid: {local_pages}/{len(pdf_document)} trang có text layer, không cần OCR")
+        finally:
+            pdf_document.close()
+
+    def classify_page(self, page):
+        """Return "text" if the page has a clean, sufficient text layer, otherwise "ocr"."""
+        text = page.get_text("text").strip()
+        if len(text) < self.min_text_chars:
+            return "ocr"
+        # Broken font encodings come out as replacement or control characters
+        garbled = sum(1 for c in text if c == "\ufffd" or (ord(c) < 32 and c not in "\n\t\r"))
+        if garbled / len(text) > 0.05:
+            return "ocr"
+        # Pages dominated by pictures (scans, diagrams, screenshots) still need the vision model
+        page_area = abs(page.rect)
+        image_area = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+        if page_area and image_area / page_area > self.max_image_ratio:
+            return "ocr"
+        return "text"
+
+    def page_to_markdown(self, page):
+        """Build markdown from the text layer, mapping font sizes to heading levels."""
+        tables = []
+        try:
+            tables = [(table.bbox, table.to_markdown()) for table in page.find_tables().tables]
+        except Exception as e:
+            print(f"Không tìm được bảng ở trang {page.number + 1}: {e}")
+        table_rects = [fitz.Rect(bbox) for bbox, _ in tables]
+
+        lines = []
+        size_weights = {}
+        for block_num, block in enumerate(page.get_text("dict", sort=True)["blocks"]):
+            if block["type"] != 0:
+                continue
+            if any(fitz.Rect(block["bbox"]).intersects(rect) for rect in table_rects):
+                continue
+            for line in block["lines"]:
+                spans = [span for span in line["spans"] if span["text"].strip()]
+                if not spans:
+                    continue
+                text = "".join(span["text"] for span in line["spans"]).strip()
+                size = round(max(span["size"] for span in spans), 1)
+                bold = all(span["flags"] & 16 for span in spans)
+                size_weights[size] = size_weights.get(size, 0) + len(text)
+                lines.append((line["bbox"][1], block_num, text, size, bold))
+
+        body_size = max(size_weights, key=size_weights.get) if size_weights else 0
+        items = [(y, block_num, self._line_to_markdown(text, size, bold, body_size))
+                 for y, block_num, text, size, bold in lines]
+        items.extend((bbox[1], None, markdown) for bbox, markdown in tables)
+        items.sort(key=lambda item: item[0])
+
+        content = ""
+        previous_block = None
+        previous_plain = False
+        for _, block_num, markdown in items:
+            plain = block_num is not None and not markdown.startswith(("#", "- "))
+            if not content:
+                content = markdown
+            elif plain and previous_plain and block_num == previous_block:
+                content += " " + markdown
+            elif plain and previous_plain or block_num is None or markdown.startswith("#"):
+                content += "\n\n" + markdown
+            else:
+                content += "\n" + markdown
+            previous_block, previous_plain = block_num, plain
+        return content
+
+    @staticmethod
+    def _line_to_markdown(text, size, bold, body_size):
+        ratio = size / body_size if body_size else 1
+        if ratio >= 1.8:
+            return f"# {text}"
+        if ratio >= 1.4:
+            return f"## {text}"
+        if ratio >= 1.15:
+            return f"### {text}"
+        if bold and len(text) < 80 and not text.endswith((".", ",", ":")):
+            return f"#### {text}"
+        if text[0] in "•·●○◦▪■–-*":
+            return f"- {text[1:].strip()}"
+        return text
+
+    @staticmethod
+    def page_count(file_stream):
+        file_stream.seek(0)
+        with fitz.open(stream=file_stream, filetype="pdf") as pdf_document:
+            count = len(pdf_document)
+        file_stream.seek(0)
+        return count
+
+    def _build_messages(self, image_base64):
+        return [
+                {
+                    "role": "system",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": self.prompt_system
+                        },
+                    ]
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": "Transcribe the content from this image into markdown format"
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": image_base64 if image_base64.startswith("data:") else f"data:image/png;base64,{image_base64}"
                             }
-                        ]
-                    }
-                ]
+                        }
+                    ]
+                }
+            ]
+
+    def transcribe_page(self, chatGPTGen, image_base64, page_num):
+        """Transcribe one page image, retrying on rate limits and server errors.
+
+        Pages already transcribed with the same prompt and model are served
+        from the page cache.
+        """
+        key = None
+        if self.page_cache is not None:
+            key = self.page_cache.make_key(image_base64, self.prompt_system, chatGPTGen.model)
+            cached = self.page_cache.get(key)
+            if cached is not None:
+                return cached
+        start = time.time()
+        response = chatGPTGen.retry_chat_completion(messages=self._build_messages(image_base64))
+        print(f"Trang {page_num + 1}: {time.time() - start:.1f}s")
+        if key is not None:
+            self.page_cache.put(key, response)
+        return response
+
+    def parse_pdf(self, image_base64s, file_name, done_pages=None, on_page=None):
+        """Transcribe pages concurrently and join them back in page order.
+
+        image_base64s may be a list of base64 images or the iter_pages /
+        iter_page_images generator; "markdown" pages are used as-is. At most
+        max_in_flight pages are rendered but not yet transcribed, so a slow
+        vision API blocks rendering instead of letting pages pile up in memory.
+
+        done_pages ({page_num: markdown}) are reused from an earlier attempt and
+        on_page(page_num, markdown) is called as soon as each new page is ready,
+        from the worker thread, so finished pages survive a later failure.
+        """
+        chatGPTGen = ChatGPTGen()
+        pages = dict(done_pages or {})
+        in_flight = {}
+
+        def transcribe(image_base64, page_num):
+            response = self.transcribe_page(chatGPTGen, image_base64, page_num)
+            if on_page is not None:
+                on_page(page_num, response)
+            return response
+        vision_pages = 0
+        cache_before = self.page_cache.stats() if self.page_cache is not None else None
+
+        def collect(done):
+            for future in done:
+                pages[in_flight.pop(future)] = future.result()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for i, item in enumerate(image_base64s):
+                page_num, kind, payload = item if isinstance(item, tuple) else (i, "image", item)
+                if kind == "markdown":
+                    pages[page_num] = payload
+                    if on_page is not None:
+                        on_page(page_num, payload)
+                    continue
+                if len(in_flight) >= self.max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight[executor.submit(transcribe, payload, page_num)] = page_num
+                vision_pages += 1
+            collect(wait(in_flight).done)
 
-            response = chatGPTGen.default_chat_completion(messages=messages)
-            content+="\n"
-            content+=response
+        self.last_parse_stats = {"pages": len(pages), "vision_pages": vision_pages}
+        if self.page_cache is not None:
+            self.page_cache.evict()
+            cache_after = self.page_cache.stats()
+            hits = cache_after["hits"] - cache_before["hits"]
+            misses = cache_after["misses"] - cache_before["misses"]
+            self.last_parse_stats.update({
+                "cache_hits": hits,
+                "cache_misses": misses,
+                "cache_hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                "cache_total": cache_after,
+            })
 
-            print(content)
-        return content
\ No newline at end of file
+        content = ""
+        for page_num in sorted(pages):
+            content += "\n"
+            content += pages[page_num]
+        print(f"{file_name}: đã xử lý {len(pages)} trang, {self.last_parse_stats}")
+        return content
@@ -0,0 +1,204 @@
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from constants.constants import QUANTIZED_INDEX_DIRECTORY
+
+# Set bits per byte value, for Hamming distances over packed binary codes (numpy < 2.0)
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(codes):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(codes).sum(axis=1, dtype=np.int32)
+    return POPCOUNT[codes].sum(axis=1, dtype=np.int32)
+
+
+class QuantizedIndex:
+    """Compact in-memory copy of the chunk embeddings with a float re-score stage.
+
+    QUANTIZED_INDEX=int8 keeps one signed byte per dimension plus a scale
+    (4x smaller than float32), QUANTIZED_INDEX=binary keeps one bit per
+    dimension (32x smaller). A query scans the codes for
+    k * QUANTIZED_RESCORE_FACTOR candidates, then re-scores only those with
+    their float vectors, fetched by ID from the Chroma collection, which
+    already stores them; this file holds nothing but the codes. Chroma keeps
+    its own HNSW index in whatever process serves the collection, so the
+    memory saved is that of the API processes that search through this
+    index instead of querying Chroma.
+    """
+    sync_every = 60
+    reload_every = 5
+    block_size = 4096
+
+    def __init__(self, name, mode=None, directory=None):
+        self.mode = mode or os.environ.get('QUANTIZED_INDEX', 'int8')
+        if self.mode not in ("int8", "binary"):
+            raise ValueError(f"Unknown QUANTIZED_INDEX mode: {self.mode}")
+        directory = directory or os.environ.get('QUANTIZED_INDEX_DIR', QUANTIZED_INDEX_DIRECTORY)
+        # One file per collection and mode, so vectors of different sizes never mix
+        self.path = os.path.join(directory, f"{name}_{self.mode}.sqlite3")
+        self.rescore_factor = int(os.environ.get('QUANTIZED_RESCORE_FACTOR', 4))
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._loaded_at = 0.0
+        self._last_sync = 0.0
+        self._mismatch = None
+        # (ids, codes, scales) of one load, replaced as a whole so searches never mix two loads
+        self._snapshot = ([], None, None)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(vectors)")]
+        if "vector" in columns:
+            # Files written before the float copies were dropped; sync() rebuilds them from Chroma
+            self.connection.execute("DROP TABLE vectors")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (rowid INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, "
+            "filename TEXT, code BLOB NOT NULL, scale REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS vectors_filename ON vectors (filename)")
+        self.connection.commit()
+
+    def quantize(self, vectors):
+        """Return (codes, scales) for a (n, dim) float array."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.mode == "binary":
+            return np.packbits(vectors > 0, axis=1), np.ones(len(vectors), dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def add(self, ids, embeddings, metadatas):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        codes, scales = self.quantize(vectors)
+        rows = [(chunk_id, (metadata or {}).get("filename", ""), codes[i].tobytes(), float(scales[i]))
+                for i, (chunk_id, metadata) in enumerate(zip(ids, metadatas))]
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO vectors (id, filename, code, scale) VALUES (?, ?, ?, ?)", rows
+            )
+            self.connection.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            self.connection.executemany("DELETE FROM vectors WHERE id = ?", [(chunk_id,) for chunk_id in ids])
+            self.connection.commit()
+
+    def delete_file(self, filename):
+        with self._lock:
+            self.connection.execute("DELETE FROM vectors WHERE filename = ?", (filename,))
+            self.connection.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def _version(self):
+        # data_version changes when another connection commits; total_changes covers our own writes
+        return self.connection.execute("PRAGMA data_version").fetchone()[0], self.connection.total_changes
+
+    def _load(self):
+        """Return the (ids, codes, scales) snapshot, reloaded first if the table changed since the last load."""
+        now = time.time()
+        snapshot = self._snapshot
+        if snapshot[1] is not None and now - self._loaded_at < self.reload_every:
+            return snapshot
+        with self._lock:
+            self._loaded_at = now
+            version = self._version()
+            if version == self._loaded_version:
+                return self._snapshot
+            rows = self.connection.execute("SELECT id, code, scale FROM vectors").fetchall()
+            dtype = np.uint8 if self.mode == "binary" else np.int8
+            codes = np.array([np.frombuffer(row[1], dtype=dtype) for row in rows]) if rows else None
+            self._snapshot = ([row[0] for row in rows], codes, np.array([row[2] for row in rows], dtype=np.float32))
+            self._loaded_version = version
+            return self._snapshot
+
+    def memory_bytes(self) -> int:
+        _, codes, scales = self._snapshot
+        return 0 if codes is None else codes.nbytes + scales.nbytes
+
+    def _candidates(self, codes, scales, queries, count):
+        """Indexes of the count best codes for each unit-length query.
+
+        All queries are scored together, block by block, so each block of
+        codes is decoded once per call and the temporary float copy stays
+        small instead of undoing the memory saving.
+        """
+        scores = np.empty((len(codes), len(queries)), dtype=np.float32)
+        query_codes = np.packbits(queries > 0, axis=1) if self.mode == "binary" else None
+        for start in range(0, len(codes), self.block_size):
+            block = codes[start:start + self.block_size]
+            if self.mode == "binary":
+                for j, query_code in enumerate(query_codes):
+                    scores[start:start + len(block), j] = -popcount(np.bitwise_xor(block, query_code))
+            else:
+                scores[start:start + len(block)] = block.astype(np.float32) @ queries.T
+        if self.mode == "int8":
+            scores *= scales[:, None]
+        count = min(count, len(scores))
+        return np.argpartition(-scores, count - 1, axis=0)[:count].T
+
+    @staticmethod
+    def _float_vectors(collection, ids):
+        """Stored float vectors of ids, read from the collection in one call; ids Chroma lacks are left out."""
+        result = collection.get(ids=list(ids), include=["embeddings"])
+        return {chunk_id: np.asarray(vector, dtype=np.float32)
+                for chunk_id, vector in zip(result['ids'], result['embeddings'])}
+
+    def search(self, query_embeddings, collection, k=10):
+        """Return one [(chunk_id, cosine distance)] list per query, best first.
+
+        collection is the Chroma collection the codes were built from; the
+        candidates of all queries are re-scored with one get() on it.
+        """
+        ids, codes, scales = self._load()
+        if codes is None:
+            return [[] for _ in query_embeddings]
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries / (np.linalg.norm(queries, axis=1, keepdims=True) + 1e-12)
+        candidates = self._candidates(codes, scales, queries, k * self.rescore_factor)
+        vectors = self._float_vectors(collection, {ids[index] for index in candidates.ravel()})
+        results = []
+        for query, indexes in zip(queries, candidates):
+            scored = []
+            for index in indexes:
+                vector = vectors.get(ids[index])
+                if vector is not None:
+                    similarity = float(vector @ query / (np.linalg.norm(vector) + 1e-12))
+                    scored.append((ids[index], 1.0 - similarity))
+            scored.sort(key=lambda item: item[1])
+            results.append(scored[:k])
+        return results
+
+    def sync(self, collection, force=False):
+        """Rebuild from the collection if the chunk counts disagree (see LexicalIndex.sync)."""
+        now = time.time()
+        if not force and now - self._last_sync < self.sync_every:
+            return
+        self._last_sync = now
+        counts = (collection.count(), self.count())
+        if counts[0] == counts[1]:
+            self._mismatch = None
+            return
+        if not force and counts != self._mismatch:
+            self._mismatch = counts
+            return
+        self._mismatch = None
+        start = time.time()
+        with self._lock:
+            self.connection.execute("DELETE FROM vectors")
+            self.connection.commit()
+        offset, page = 0, 1000
+        while True:
+            result = collection.get(include=["embeddings", "metadatas"], limit=page, offset=offset)
+            if not len(result['ids']):
+                break
+            self.add(result['ids'], result['embeddings'], result['metadatas'])
+            offset += len(result['ids'])
+        print(f"Quantized index ({self.mode}) rebuilt with {offset} chunks in {time.time() - start:.1f}s")
@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+
+
+class RetrievalFusion:
+    """Merge the ranked results of several expanded queries into one context list.
+
+    QUERY_FUSION selects reciprocal-rank fusion ("rrf", default), which
+    rewards chunks that several queries agree on, or score fusion ("score"),
+    which keeps the best cosine similarity of each chunk. Candidates are
+    scored with NumPy over flat arrays, then collapsed by the section they
+    belong to. QUERY_MMR=true adds a maximal marginal
+    relevance pass over the chunk embeddings so near-identical sections do
+    not crowd out the rest of the prompt.
+    """
+
+    def __init__(self):
+        self.top_k = int(os.environ.get('QUERY_TOP_K', 10))
+        self.max_documents = int(os.environ.get('QUERY_MAX_DOCUMENTS', 20))
+        self.method = os.environ.get('QUERY_FUSION', 'rrf')
+        self.rrf_k = int(os.environ.get('QUERY_RRF_K', 60))
+        self.use_mmr = os.environ.get('QUERY_MMR', 'false').lower() == 'true'
+        self.mmr_lambda = float(os.environ.get('QUERY_MMR_LAMBDA', 0.7))
+
+    def fuse(self, ids, distances):
+        """Score every distinct chunk ID across the per-query result lists.
+
+        ids and distances are Chroma's nested lists (one list per query).
+        Returns (unique_ids, scores, first_position), with first_position
+        pointing into the flattened results, sorted by descending score.
+        """
+        index_of, unique_ids, first_position, inverse = {}, [], [], []
+        flat_distances, ranks = [], []
+        for row_ids, row_distances in zip(ids, distances):
+            for rank, (chunk_id, distance) in enumerate(zip(row_ids, row_distances)):
+                index = index_of.get(chunk_id)
+                if index is None:
+                    index = index_of[chunk_id] = len(unique_ids)
+                    unique_ids.append(chunk_id)
+                    first_position.append(len(inverse))
+                inverse.append(index)
+                flat_distances.append(distance)
+                ranks.append(rank)
+        if not unique_ids:
+            return [], np.empty(0), np.empty(0, dtype=np.int64)
+        inverse = np.array(inverse)
+        flat_distances = np.array(flat_distances, dtype=np.float64)
+        ranks = np.array(ranks)
+        first_position = np.array(first_position)
+
+        if self.method == "score":
+            scores = np.full(len(unique_ids), -np.inf)
+            np.maximum.at(scores, inverse, 1.0 - flat_distances)
+        else:
+            scores = np.bincount(inverse, weights=1.0 / (self.rrf_k + ranks + 1), minlength=len(unique_ids))
+
+        order = np.argsort(-scores, kind="stable")
+        return [unique_ids[i] for i in order], scores[order], first_position[order]
+
+    def mmr(self, scores, embeddings, count):
+        """Indexes of count candidates picked by maximal marginal relevance."""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        relevance = (scores - scores.min()) / (scores.max() - scores.min() + 1e-12)
+        selected = [0]
+        max_similarity = vectors @ vectors[0]
+        while len(selected) < min(count, len(scores)):
+            mmr_scores = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * max_similarity
+            mmr_scores[selected] = -np.inf
+            best = int(np.argmax(mmr_scores))
+            selected.append(best)
+            max_similarity = np.maximum(max_similarity, vectors @ vectors[best])
+        return selected
+
+    def select(self, collection_answer, key_of):
+        """Fuse a Chroma query result and return the metadata of up to max_documents chunks.
+
+        key_of maps (document, metadata) to the section a chunk belongs to;
+        only the best chunk of each section is kept.
+        """
+        unique_ids, scores, positions = self.fuse(collection_answer['ids'], collection_answer['distances'])
+        documents = [document for row in collection_answer['documents'] for document in row]
+        metadatas = [metadata for row in collection_answer['metadatas'] for metadata in row]
+
+        order = range(len(unique_ids))
+        if self.use_mmr and collection_answer.get('embeddings') is not None and len(unique_ids) > 1:
+            flat_embeddings = [vector for row in collection_answer['embeddings'] for vector in row]
+            order = self.mmr(scores, [flat_embeddings[p] for p in positions], len(unique_ids))
+
+        seen = set()
+        picked = []
+        for index in order:
+            metadata = metadatas[positions[index]]
+            key = key_of(documents[positions[index]], metadata)
+            if key in seen:
+                continue
+            seen.add(key)
+            picked.append(metadata)
+            if len(picked) == self.max_documents:
+                break
+        return picked
@@ -0,0 +1,38 @@
+import os
+import sqlite3
+import threading
+
+from constants.constants import SHARD_REGISTRY_PATH
+
+
+class ShardRegistry:
+    """Which course (collection shard) every ingested file was stored in.
+
+    Lets deletes, quizzes and re-uploads find a file's chunks without
+    scanning every shard. Shared by the API and worker processes.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('SHARD_REGISTRY_PATH', SHARD_REGISTRY_PATH)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, course TEXT)")
+        self.connection.commit()
+
+    def get(self, filename):
+        """(found, course) for filename; course is None for the default shard."""
+        with self._lock:
+            row = self.connection.execute("SELECT course FROM files WHERE filename = ?", (filename,)).fetchone()
+        return (row is not None), (row[0] if row else None)
+
+    def set(self, filename, course):
+        with self._lock:
+            self.connection.execute("INSERT OR REPLACE INTO files (filename, course) VALUES (?, ?)", (filename, course))
+            self.connection.commit()
+
+    def remove(self, filename):
+        with self._lock:
+            self.connection.execute("DELETE FROM files WHERE filename = ?", (filename,))
+            self.connection.commit()
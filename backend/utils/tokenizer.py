@@ -0,0 +1,39 @@
+import re
+from functools import lru_cache
+
+import tiktoken
+
+
+class ApproximateEncoding:
+    """Stand-in for a tiktoken encoding when its BPE file cannot be downloaded.
+
+    Counts words and punctuation marks as tokens, which is close enough for
+    chunk sizing and batching on an offline machine. decode() joins tokens
+    with spaces, so truncated text loses its original spacing.
+    """
+    name = "approximate"
+    pattern = re.compile(r"\w+|[^\w\s]")
+
+    def encode(self, text, **kwargs):
+        return self.pattern.findall(text)
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@lru_cache(maxsize=None)
+def load_encoding(name="cl100k_base", model=None):
+    """tiktoken encoding for model (or by name), or ApproximateEncoding when offline.
+
+    Cached, so an offline process tries the download only once per encoding.
+    """
+    try:
+        if model:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                pass
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"tiktoken encoding {name} unavailable ({e}), counting tokens approximately")
+        return ApproximateEncoding()